@@ -9,7 +9,7 @@ function formatDate(value: string) {
 }
 
 export default function Page() {
-  const { stories } = useData<Data>()
+  const { stories, nextCursor } = useData<Data>()
 
   return (
     <main className="min-h-screen bg-background text-foreground px-6 py-10 md:py-14">
@@ -42,6 +42,17 @@ export default function Page() {
             </a>
           ))}
         </div>
+
+        {nextCursor ? (
+          <div className="mt-8 text-center">
+            <a
+              href={`/stories?cursor=${encodeURIComponent(nextCursor)}`}
+              className="text-sm text-muted-foreground hover:text-foreground transition-colors"
+            >
+              Older stories
+            </a>
+          </div>
+        ) : null}
       </div>
     </main>
   )
@@ -2,17 +2,26 @@ import type { PageContextServer } from 'vike/types'
 import type { StorySummary } from '../../src/api'
 import { fetchDjango } from '../lib/djangoApi'
 
+const PAGE_SIZE = 50
+
 export type Data = {
   stories: StorySummary[]
+  nextCursor: string | null
 }
 
 export async function data(pageContext: PageContextServer): Promise<Data> {
-  const response = await fetchDjango('/api/stories/', pageContext.headers)
+  const params = new URLSearchParams({ view: 'summary', limit: String(PAGE_SIZE) })
+  const cursor = pageContext.urlParsed.search.cursor
+  if (cursor) {
+    params.set('cursor', cursor)
+  }
+
+  const response = await fetchDjango(`/api/stories/?${params}`, pageContext.headers)
 
   if (!response.ok) {
     throw new Error(`Failed to load stories: ${response.status}`)
   }
 
   const stories = (await response.json()) as StorySummary[]
-  return { stories }
+  return { stories, nextCursor: response.headers.get('X-Next-Cursor') }
 }
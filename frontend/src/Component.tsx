@@ -145,10 +145,10 @@ export function TaleTinkerApp() {
     }
   }, [headId, isEnded, viewMode]);
 
-  // Load stories from API
+  // Load stories from API (again once we know the viewer is logged in)
   useEffect(() => {
-    api.listStories().then(setStories).catch(err => console.error("Failed to load stories", err));
-  }, []);
+    api.listStories(isLoggedIn).then(setStories).catch(err => console.error("Failed to load stories", err));
+  }, [isLoggedIn]);
 
   useEffect(() => {
     api.getStoryConfig()
@@ -277,13 +277,15 @@ export function TaleTinkerApp() {
   const [previousStoryId, setPreviousStoryId] = useState<string | null>(null);
   const suggestionRequestId = useRef(0);
 
-  const fetchSuggestions = async (context: string[], includeEndOption: boolean) => {
+  // With the uuid of the saved line the context ends on, suggestions are kept
+  // on that line and served to the next reader without a model call
+  const fetchSuggestions = async (context: string[], includeEndOption: boolean, lineUuid?: string) => {
     const requestId = ++suggestionRequestId.current;
     setIsLoadingSuggestions(true);
     setSuggestions([]);
 
     try {
-      const options = await api.suggestLines(context);
+      const options = await api.suggestLines(context, lineUuid);
       if (suggestionRequestId.current !== requestId) return;
 
       const trimmedOptions = options
@@ -356,7 +358,7 @@ export function TaleTinkerApp() {
     // If it's a runtime story (newly created but not saved to backend), handle separately?
     // For now, assume we primarily read from backend.
     try {
-      const story = await api.getStory(id);
+      const story = await api.getStory(id, isLoggedIn);
       setActiveStory(story);
       setSelectedStoryId(id);
       setViewMode('read');
@@ -395,7 +397,7 @@ export function TaleTinkerApp() {
 
 
 
-  const handleForkFromLine = async (textLineIndex: number, storyLines: string[], alternativeText?: string) => {
+  const handleForkFromLine = async (textLineIndex: number, storyLines: string[], alternativeText?: string, storyLineUuids?: string[]) => {
     // If alternativeText is provided, we are SWITCHING to an alternative path in READ mode
     if (alternativeText) {
       // 1. Construct the new story path
@@ -469,7 +471,8 @@ export function TaleTinkerApp() {
         parentId: previousId,
         childrenIds: [],
         createdAt: Date.now() + i * 1000, // Stagger times
-        isCustom: false // Assume from library is "ai" or "standard"
+        isCustom: false, // Assume from library is "ai" or "standard"
+        lineUuid: storyLineUuids?.[i]
       };
 
       newNodes[id] = node;
@@ -491,7 +494,7 @@ export function TaleTinkerApp() {
     // Determine path length
     const pathLength = textLineIndex + 1;
     const context = effectiveLines.slice(0, pathLength);
-    void fetchSuggestions(context, canEndStory(pathLength));
+    void fetchSuggestions(context, canEndStory(pathLength), storyLineUuids?.[textLineIndex]);
 
     setIsEnded(false);
 
@@ -532,7 +535,7 @@ export function TaleTinkerApp() {
       try {
         const created = await api.createStory({ title: null, tagline: null, lines });
         setSavedStoryId(created.id);
-        void api.listStories().then(setStories).catch(err => console.error("Failed to refresh stories", err));
+        void api.listStories(isLoggedIn).then(setStories).catch(err => console.error("Failed to refresh stories", err));
         try {
           const meta = await api.suggestStoryMeta(lines);
           const nextTitle = meta.title || '';
@@ -641,12 +644,12 @@ export function TaleTinkerApp() {
       else break;
     }
 
-    void fetchSuggestions(branchContext, canEndStory(branchContext.length));
+    void fetchSuggestions(branchContext, canEndStory(branchContext.length), nodes[nodeId]?.lineUuid);
   };
 
   const handleRefreshSuggestions = () => {
     const context = currentPath.map((node) => node.text);
-    void fetchSuggestions(context, canEndStory(context.length));
+    void fetchSuggestions(context, canEndStory(context.length), currentPath[currentPath.length - 1]?.lineUuid);
   };
 
   const handleSaveAndView = async () => {
@@ -660,7 +663,7 @@ export function TaleTinkerApp() {
       setStories(prev =>
         prev.map(story => story.uuid === savedStoryId ? { ...story, title: updated.title, tagline: updated.tagline } : story)
       );
-      const story = await api.getStory(savedStoryId);
+      const story = await api.getStory(savedStoryId, isLoggedIn);
       setActiveStory(story);
       setSelectedStoryId(savedStoryId);
       setViewMode('read');
@@ -872,6 +875,7 @@ export function TaleTinkerApp() {
                 // Legacy support for onFork (requires mapping back to string array?)
                 // handleForkFromLine expects string[].
                 const lineTexts = story.lines.map(l => l.text);
+                const lineUuids = story.lines.map(l => l.id);
 
                 return (
                   <div className="h-full overflow-y-auto">
@@ -881,7 +885,7 @@ export function TaleTinkerApp() {
                       authorName={story.author_name}
                       path={detailNodes}
                       onFork={(nodeId, index, altText) => {
-                        void handleForkFromLine(index, lineTexts, altText);
+                        void handleForkFromLine(index, lineTexts, altText, lineUuids);
                       }}
                       onBack={handleBack}
                       onToggleTree={() => setShowTreeView(!showTreeView)}
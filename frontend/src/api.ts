@@ -46,13 +46,44 @@ export interface StoryData {
     root_node_id?: string | null;
 }
 
+interface MyLikes {
+    stories: string[];
+    lines: string[];
+    cursor: string;
+}
+
+// Logged in viewers fetch the shared (anonymous) payload, which the server
+// serves from its cache, and overlay their own likes on it
+function withMyLikes<T extends StorySummary | StoryData>(story: T, likes: MyLikes): T {
+    const likedLines = new Set(likes.lines);
+    return {
+        ...story,
+        is_liked: likes.stories.includes(story.uuid),
+        lines: story.lines?.map(line => ({ ...line, is_liked: likedLines.has(line.id) })),
+    };
+}
+
 export const api = {
-    async listStories(): Promise<StorySummary[]> {
-        return fetchJson(`${API_BASE}/stories/`, { method: 'GET' }, 'Failed to fetch stories');
+    async listStories(loggedIn = false): Promise<StorySummary[]> {
+        if (!loggedIn) {
+            return fetchJson(`${API_BASE}/stories/`, { method: 'GET' }, 'Failed to fetch stories');
+        }
+        const [stories, likes] = await Promise.all([
+            fetchJson<StorySummary[]>(`${API_BASE}/stories/?shared=true`, { method: 'GET' }, 'Failed to fetch stories'),
+            api.getMyLikes(),
+        ]);
+        return stories.map(story => withMyLikes(story, likes));
     },
 
-    async getStory(id: string): Promise<StoryData> {
-        return fetchJson(`${API_BASE}/stories/${id}`, { method: 'GET' }, 'Failed to fetch story');
+    async getStory(id: string, loggedIn = false): Promise<StoryData> {
+        if (!loggedIn) {
+            return fetchJson(`${API_BASE}/stories/${id}`, { method: 'GET' }, 'Failed to fetch story');
+        }
+        const [story, likes] = await Promise.all([
+            fetchJson<StoryData>(`${API_BASE}/stories/${id}?shared=true`, { method: 'GET' }, 'Failed to fetch story'),
+            api.getMyLikes(),
+        ]);
+        return withMyLikes(story, likes);
     },
 
     async createStory(data: { title?: string | null; tagline?: string | null; lines: string[] }): Promise<{ id: string; title: string | null; tagline: string | null; success: boolean }> {
@@ -63,11 +94,11 @@ export const api = {
         }, 'Failed to create story');
     },
 
-    async suggestLines(context: string[]): Promise<string[]> {
+    async suggestLines(context: string[], lineUuid?: string): Promise<string[]> {
         return fetchJson(`${API_BASE}/stories/suggest`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ context })
+            body: JSON.stringify({ context, line_uuid: lineUuid })
         }, 'Failed to fetch suggestions');
     },
 
@@ -129,5 +160,9 @@ export const api = {
 
     async likeLine(id: string): Promise<{ success: boolean; like_count: number; is_liked: boolean }> {
         return fetchJson(`${API_BASE}/stories/lines/${id}/like`, { method: 'POST' }, 'Failed to like line');
+    },
+
+    async getMyLikes(): Promise<MyLikes> {
+        return fetchJson(`${API_BASE}/stories/likes/mine`, { method: 'GET' }, 'Failed to fetch likes');
     }
 };
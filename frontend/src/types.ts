@@ -13,6 +13,7 @@ export interface StoryNode {
   alternatives?: string[]; // Other choices available at this step
   likes?: number; // Number of likes
   isLiked?: boolean;
+  lineUuid?: string; // The saved line on the server, if this node came from one
 }
 
 export interface Choice {
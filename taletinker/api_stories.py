@@ -1,13 +1,33 @@
+from datetime import datetime
 from typing import List
 from ninja import Router, Schema
 from ninja.errors import HttpError
 from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from pydantic import BaseModel
-import openai
+from asgiref.sync import sync_to_async
+import base64
+import hashlib
+import json
 import os
+import uuid
 
-from taletinker.stories.models import Story, Line
+try:
+    import orjson
+except ImportError:  # optional, only speeds up STORY_FAST_RESPONSES
+    orjson = None
+
+from taletinker import openai_client
+from taletinker.cache import get_or_compute
+from taletinker.stories import like_buffer, line_cache, response_cache, suggestion_cache
+from taletinker.stories.models import Story, Line, line_snapshot
 
 router = Router()
 
@@ -78,10 +98,27 @@ class StorySchema(Schema):
     length: int
     author_name: str | None = None
     like_count: int = 0
-    like_count: int = 0
     is_liked: bool = False
     root_node_id: str | None = None
 
+class StoryListSchema(Schema):
+    """
+    A story in the library list; fields can be left out with ``view`` or
+    ``fields``, so everything but the ids is optional.
+    """
+    id: int
+    uuid: str
+    title: str | None = None
+    tagline: str | None = None
+    preview: str | None = None
+    lines: List[LineSchema] | None = None
+    created_at: str | None = None
+    length: int | None = None
+    author_name: str | None = None
+    like_count: int | None = None
+    is_liked: bool | None = None
+    root_node_id: str | None = None
+
 class StoryCreateSchema(Schema):
     title: str | None = None
     tagline: str | None = None
@@ -98,67 +135,328 @@ class LikeResponse(Schema):
     like_count: int
     is_liked: bool
 
-@router.get("/", response=List[StorySchema])
-def list_stories(request):
-    # Optimize query with annotations for likes
+def invalidate_likes(obj):
+    """
+    Expires the cached responses showing the like count of a Story or Line
+    """
+    if isinstance(obj, Story):
+        response_cache.bump_stories(obj.uuid)
+        response_cache.bump_list()
+    else:
+        # Every story running through the line shows its count
+        response_cache.bump_stories(*Story.objects.filter(last_line__path__startswith=obj.path).values_list("uuid", flat=True))
+        invalidate_story_tree(obj.root_id)
+
+def set_like(obj, user, liked: bool) -> int:
+    """
+    Likes or unlikes a Story or Line for ``user``, through the write-behind
+    buffer when it is enabled; returns the like count the user should see
+    """
+    if not like_buffer.enabled():
+        like_count = type(obj).objects.set_liked(obj.pk, user, liked)
+        invalidate_likes(obj)
+        return like_count
+
+    stored_liked = obj.liked_by.filter(id=user.id).exists()
+    try:
+        like_buffer.record(obj, user, liked)
+    except like_buffer.LikeBufferBusy:
+        raise HttpError(503, "Please try again")
+    pending = {(obj._meta.model_name, obj.pk): liked}
+    return like_buffer.overlay(type(obj), obj.pk, obj.like_count, stored_liked, pending)[0]
+
+def toggle_like(obj, user) -> bool:
+    """
+    Flips ``user``'s like on a Story or Line, updating ``obj.like_count``;
+    returns the new state
+    """
+    liked = obj.liked_by.filter(id=user.id).exists()
+    if like_buffer.enabled():
+        liked = like_buffer.pending_for_user(user).get((obj._meta.model_name, obj.pk), liked)
+    liked = not liked
+    obj.like_count = set_like(obj, user, liked)
+    return liked
+
+
+_STORY_LIST_FIELDS = set(StoryListSchema.model_fields)
+
+
+def _story_list_fields(view: str, fields: str | None) -> set:
+    if fields:
+        wanted = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = wanted - _STORY_LIST_FIELDS
+        if unknown:
+            raise HttpError(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+        return wanted | {"id", "uuid"}
+    if view == "summary":
+        return _STORY_LIST_FIELDS - {"lines"}
+    if view != "full":
+        raise HttpError(400, "view must be 'full' or 'summary'")
+    return set(_STORY_LIST_FIELDS)
+
+def _encode_story_cursor(story) -> str:
+    raw = json.dumps([story.created_at.isoformat(), story.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_story_cursor(value: str):
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        created_at, pk = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        raise HttpError(400, "Invalid cursor")
+
+
+class MyLikesResponse(Schema):
+    stories: List[str] # UUIDs
+    lines: List[str] # UUIDs
+    cursor: str # pass as ``since`` to only get likes added after this response
+
+
+class TreeStorySchema(Schema):
+    id: str # UUID
+    title: str | None
+
+class TreeNodeSchema(Schema):
+    id: str # UUID
+    parent: int | None # index of the parent in ``nodes``
+    text: str
+    is_manual: bool
+    like_count: int
+    stories: List[TreeStorySchema] # stories ending at this node
+
+class StoryTreeSchema(Schema):
+    root_id: str # UUID
+    nodes: List[TreeNodeSchema]
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+def _viewer(request, shared):
+    """
+    Returns the user whose likes go into a story payload: nobody with
+    ``shared``, where logged in clients take the anonymous payload (served
+    from the shared cache) and overlay their own likes from ``/likes/mine``
+    """
+    return AnonymousUser() if shared else request.user
+
+def _conditional_get(request, response, generation, user):
+    """
+    Sets a strong ETag on ``response`` from a response cache generation
+    (plus ``user``, whose likes are part of the payload) and returns a
+    304 response if the client's copy is still current. No Last-Modified:
+    it only has one second resolution and can't reflect pending likes.
+    """
+    viewer = ""
+    if user.is_authenticated:
+        viewer = str(user.id)
+        if like_buffer.enabled():
+            viewer += repr(sorted(like_buffer.pending_for_user(user).items()))
+    etag = quote_etag(hashlib.sha1(f"{generation}:{viewer}".encode()).hexdigest())
+
+    conditional = get_conditional_response(request, etag=etag)
+    if conditional is not None:
+        conditional["ETag"] = etag
+        return conditional
+
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Cookie"])
+    return None
+
+def _render(response, payload):
+    """
+    With ``STORY_FAST_RESPONSES`` on, encodes ``payload`` (already shaped
+    like the response schema) straight to JSON instead of letting ninja
+    validate it again, keeping the headers set on the temporal ``response``
+    """
+    if not settings.STORY_FAST_RESPONSES:
+        return payload
+    content = orjson.dumps(payload) if orjson else json.dumps(payload, separators=(",", ":"))
+    rendered = HttpResponse(content, content_type="application/json; charset=utf-8")
+    for header, value in response.items():
+        rendered[header] = value
+    return rendered
+
+def _tree_cache_key(root_id) -> str:
+    return f"stories:tree:{root_id}"
+
+def invalidate_story_tree(root_id):
+    if root_id:
+        cache.delete(_tree_cache_key(root_id))
+
+def build_story_tree(root_id):
+    """
+    Builds the compact adjacency list of every line under ``root_id``;
+    parents always precede their children.
+    """
+    lines = (
+        Line.objects.filter(root_id=root_id)
+        .order_by("depth", "id")
+        .values("id", "uuid", "previous_id", "text", "is_manual", "like_count")
+    )
+    stories_by_line = {}
+    on_stories = set()
+    stories = Story.objects.filter(last_line__root_id=root_id).order_by("created_at")
+    for story in stories.values("uuid", "title", "last_line_id", "last_line__path"):
+        stories_by_line.setdefault(story["last_line_id"], []).append({
+            "id": str(story["uuid"]),
+            "title": story["title"],
+        })
+        on_stories.update(int(pk) for pk in story["last_line__path"].split("/") if pk)
+
+    index = {}
+    nodes = []
+    for line in lines:
+        # Suggested candidates nobody has used yet are not part of the tree
+        if not line["is_manual"] and line["id"] not in on_stories:
+            continue
+        if line["previous_id"] is not None and line["previous_id"] not in index:
+            continue
+        index[line["id"]] = len(nodes)
+        nodes.append({
+            "id": str(line["uuid"]),
+            "parent": index.get(line["previous_id"]),
+            "text": line["text"],
+            "is_manual": line["is_manual"],
+            "like_count": line["like_count"],
+            "stories": stories_by_line.get(line["id"], []),
+        })
+    return {
+        "root_id": nodes[0]["id"] if nodes else "",
+        "nodes": nodes,
+    }
+
+@router.get("/", response=List[StoryListSchema], exclude_unset=True)
+def list_stories(
+    request,
+    response: HttpResponse,
+    cursor: str | None = None,
+    limit: int | None = None,
+    view: str = "full",
+    fields: str | None = None,
+    shared: bool = False,
+):
+    """
+    Lists stories newest first. With ``limit`` the list is paginated by a
+    (created_at, id) keyset; the cursor of the next page is returned in the
+    ``X-Next-Cursor`` header. ``view=summary`` leaves out the lines and
+    ``fields`` picks a comma separated subset of fields (id and uuid are
+    always included). ``shared`` returns the anonymous payload, see
+    ``_viewer``.
+    """
+    wanted = _story_list_fields(view, fields)
+    user = _viewer(request, shared)
+
+    generation = response_cache.list_generation()
+    not_modified = _conditional_get(request, response, generation, user)
+    if not_modified:
+        return not_modified
+
+    # Anonymous responses are the same for everyone, so share them
+    cache_key = None
+    if not user.is_authenticated:
+        cache_key = response_cache.list_key(generation, cursor=cursor, limit=limit, view=view, fields=fields)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            results, next_cursor = cached
+            if next_cursor:
+                response["X-Next-Cursor"] = next_cursor
+            return _render(response, results)
+
+    # Liked flags are annotated and lines come from the story snapshots so the
+    # query count does not depend on the number of stories.
     # author is likely on last_line, so we traverse last_line__author
-    stories = Story.objects.all().select_related('last_line__author').order_by('-created_at')
-    
+    stories = Story.objects.select_related('last_line__author').order_by('-created_at', '-id')
+    if "lines" not in wanted and "root_node_id" not in wanted:
+        stories = stories.defer("lines_snapshot")
+    pending_likes = like_buffer.pending_for_user(user) if like_buffer.enabled() else {}
+    if "is_liked" in wanted or pending_likes:
+        stories = stories.with_is_liked(user)
+    if cursor:
+        created_at, pk = _decode_story_cursor(cursor)
+        stories = stories.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    if limit is not None:
+        limit = min(max(limit, 1), settings.STORY_LIST_MAX_LIMIT)
+        stories = list(stories[:limit + 1])
+        if len(stories) > limit:
+            stories = stories[:limit]
+            response["X-Next-Cursor"] = _encode_story_cursor(stories[-1])
+
+    snapshots = {}
+    if "lines" in wanted or "root_node_id" in wanted:
+        # Stories not backfilled yet fall back to the node cache
+        unfrozen = [s for s in stories if s.last_line_id and not s.lines_snapshot]
+        chains = line_cache.get_ancestors_many(
+            [s.last_line_id for s in unfrozen],
+            {s.last_line_id: s.last_line.path for s in unfrozen},
+        )
+        snapshots = {s.pk: s.lines_snapshot or line_snapshot(chains.get(s.last_line_id, [])) for s in stories}
+
     results = []
     
     for s in stories:
-        is_liked = False
-        if request.user.is_authenticated:
-            is_liked = s.liked_by.filter(id=request.user.id).exists()
-        
-        like_count = s.liked_by.count()
-
-        # Preview from tagline (library/landing view)
-        preview = s.tagline or ""
-        
-        # Safe author access
-        author_name = get_author_display_name(s.last_line.author if s.last_line else None)
-        
-        # Find root node for tree grouping
-        # Build lines and find root
-        curr = s.last_line
-        story_lines = []
-        
-        temp = curr
-        depth = 0
-        while temp and depth < 100:
-             story_lines.insert(0, {
-                 "id": str(temp.uuid),
-                 "text": temp.text,
-                 "is_manual": temp.is_manual,
-                 "like_count": 0, # Optimization: skip line likes in list view
-                 "is_liked": False
-             })
-             temp = temp.previous
-             depth += 1
-        
-        root_id = story_lines[0]['id'] if story_lines else None
+        item = {"id": s.id, "uuid": str(s.uuid)}
+
+        if pending_likes:
+            like_count, is_liked = like_buffer.overlay(Story, s.pk, s.like_count, s.is_liked, pending_likes)
+        else:
+            like_count, is_liked = s.like_count, getattr(s, "is_liked", False)
+
+        if "is_liked" in wanted:
+            item["is_liked"] = is_liked
+
+        if "like_count" in wanted:
+            item["like_count"] = like_count
+
+        if "lines" in wanted:
+            item["lines"] = [
+                {
+                    "id": line_uuid,
+                    "text": text,
+                    "is_manual": is_manual,
+                    "like_count": 0, # Optimization: skip line likes in list view
+                    "is_liked": False
+                }
+                for line_uuid, text, is_manual in snapshots[s.pk]
+            ]
 
-        results.append({
-            "id": s.id,
-            "uuid": str(s.uuid),
+        item.update({
             "title": s.title,
             "tagline": s.tagline,
-            "preview": preview,
-            "lines": story_lines, 
+            # Preview from tagline (library/landing view)
+            "preview": s.tagline or "",
             "created_at": s.created_at.isoformat() if s.created_at else "",
-            "length": len(story_lines), 
-            "author_name": author_name,
-            "like_count": like_count,
-            "is_liked": is_liked,
-            "root_node_id": root_id
+            "length": s.length,
+            # Safe author access
+            "author_name": get_author_display_name(s.last_line.author if s.last_line else None),
+            "root_node_id": snapshots[s.pk][0][0] if snapshots.get(s.pk) else None,
         })
-    return results
+
+        results.append({key: value for key, value in item.items() if key in wanted})
+
+    if cache_key:
+        cache.set(cache_key, (results, response.get("X-Next-Cursor")), settings.STORY_RESPONSE_CACHE_TIMEOUT)
+    return _render(response, results)
 
 
 class SuggestSchema(Schema):
     context: List[str]
 
+class LineSuggestSchema(Schema):
+    """
+    The story so far, either as its lines or as the uuid of its last line
+    (which takes precedence and keeps the suggestions on that node)
+    """
+    context: List[str] = []
+    line_uuid: str | None = None
+    strategy: str | None = None
+    # "model" or "reuse", see SUGGESTION_STRATEGY
+
 class LineCheckSchema(Schema):
     line: str
     context: List[str] | None = None
@@ -192,38 +490,78 @@ class StoryMetaOptions(BaseModel):
     title: str
     tagline: str
 
-@router.post("/suggest", response=List[str])
-def suggest_lines(request, data: SuggestSchema):
-    if not data.context:
-         # Initial prompts if context is empty
-         return [
-             "Once upon a time, in a magical forest...", 
-             "The little robot woke up with a beep..."
-         ]
+_SUGGESTION_STRATEGIES = {"model", "reuse"}
+
+
+def existing_suggestions(node, strategy, count=2):
+    """
+    Returns up to ``count`` continuations of ``node`` already in the tree:
+    with the "reuse" strategy, the human-written children ranked by likes
+    and how far they were continued, then the candidates generated earlier
+    """
+    options = []
+    if strategy == "reuse":
+        options = list(
+            node.next.filter(is_manual=True)
+            .with_descendant_count()
+            .order_by("-like_count", "-descendant_count", "id")
+            .values_list("text", flat=True)[:count]
+        )
+    if len(options) < count:
+        options += node.next.filter(is_manual=False).order_by("id").values_list("text", flat=True)[:count - len(options)]
+    return options
+
+
+_INITIAL_SUGGESTIONS = [
+    "Once upon a time, in a magical forest...",
+    "The little robot woke up with a beep...",
+]
+
+
+def _require_openai_key():
+    if not os.getenv("OPENAI_API_KEY"):
+        raise HttpError(500, "OPENAI_API_KEY not configured")
+
+
+def _suggestion_context(data: LineSuggestSchema):
+    """
+    Returns the node addressed by ``data`` (if any), the suggestions it
+    already has and the story context to prompt with
+    """
+    strategy = data.strategy or settings.SUGGESTION_STRATEGY
+    if strategy not in _SUGGESTION_STRATEGIES:
+        raise HttpError(400, f"Unknown strategy: {strategy}")
+
+    if not data.line_uuid:
+        return None, [], data.context
+    if not _is_uuid(data.line_uuid):
+        raise HttpError(404, "Line not found")
+    try:
+        node = Line.objects.get(uuid=data.line_uuid)
+    except Line.DoesNotExist:
+        raise HttpError(404, "Line not found")
+
+    existing = existing_suggestions(node, strategy)
+    if len(existing) == 2:
+        return node, existing, []
+    return node, existing, [line.text for line in line_cache.get_ancestors(node.id, node.path)]
+
 
+def _suggestion_messages(context):
     prompt = (
         "Continue the following children's story with 2 distinct, single-sentence options for what happens next.\\n"
         "Return the options as a structured list.\\n\\nStory:\\n"
-    ) + "\\n".join(data.context)
-    
-    if not os.getenv("OPENAI_API_KEY"):
-        raise HttpError(500, "OPENAI_API_KEY not configured")
-    
-    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
-    response = client.responses.parse(
-        model=settings.AI_DEFAULT_MODEL,
-        input=[{
-            "role": "system",
-            "content": "You are a helpful assistant for writing children's stories. "
-                       "You provide engaging continuations."
-        }, {
-            "role": "user", "content": prompt
-        }],
-        text_format=StoryOptions,
-        **_openai_reasoning_params(),
-    )
-    
+    ) + "\\n".join(context)
+    return [{
+        "role": "system",
+        "content": "You are a helpful assistant for writing children's stories. "
+                   "You provide engaging continuations."
+    }, {
+        "role": "user", "content": prompt
+    }]
+
+
+def _suggestion_options(response):
     event = response.output_parsed
     options = [option.strip() for option in (event.options or []) if option and option.strip()]
 
@@ -233,9 +571,75 @@ def suggest_lines(request, data: SuggestSchema):
     return options[:2]
 
 
-@router.post("/check-line", response=LineCheckResponse)
-def check_line(request, data: LineCheckSchema):
-    line = (data.line or "").strip()
+def _keep_candidates(node, options):
+    # Keep them on the node as candidate children for the next visitor
+    with transaction.atomic():
+        Line.objects.create_children(node, options, is_manual=False)
+
+
+def suggest_lines(request, data: LineSuggestSchema):
+    node, existing, context = _suggestion_context(data)
+    if len(existing) == 2:
+        return existing
+    if not context:
+        # Initial prompts if context is empty
+        return _INITIAL_SUGGESTIONS
+
+    messages = _suggestion_messages(context)
+
+    def generate():
+        _require_openai_key()
+        response = openai_client.for_endpoint("suggest").responses.parse(
+            model=settings.AI_DEFAULT_MODEL,
+            input=messages,
+            text_format=StoryOptions,
+            **_openai_reasoning_params(),
+        )
+        return _suggestion_options(response)
+
+    # Many readers reach the same context, so answers are shared
+    options = suggestion_cache.get_or_generate(
+        "lines", settings.AI_DEFAULT_MODEL, messages, _openai_reasoning_params(), generate,
+        lock_timeout=openai_client.call_budget("suggest"),
+    )
+    if node is not None:
+        _keep_candidates(node, options)
+    return (existing + [option for option in options if option not in existing])[:2]
+
+
+async def asuggest_lines(request, data: LineSuggestSchema):
+    node, existing, context = await sync_to_async(_suggestion_context)(data)
+    if len(existing) == 2:
+        return existing
+    if not context:
+        return _INITIAL_SUGGESTIONS
+
+    messages = _suggestion_messages(context)
+
+    async def generate():
+        _require_openai_key()
+        response = await openai_client.for_endpoint_async("suggest").responses.parse(
+            model=settings.AI_DEFAULT_MODEL,
+            input=messages,
+            text_format=StoryOptions,
+            **_openai_reasoning_params(),
+        )
+        return _suggestion_options(response)
+
+    options = await suggestion_cache.aget_or_generate(
+        "lines", settings.AI_DEFAULT_MODEL, messages, _openai_reasoning_params(), generate,
+        lock_timeout=openai_client.call_budget("suggest"),
+    )
+    if node is not None:
+        await sync_to_async(_keep_candidates)(node, options)
+    return (existing + [option for option in options if option not in existing])[:2]
+
+
+def _line_check_rejection(line):
+    """
+    Returns the response rejecting ``line`` without asking the model, or
+    None if it passes the cheap checks
+    """
     if not line:
         return {
             "is_valid": False,
@@ -265,7 +669,10 @@ def check_line(request, data: LineCheckSchema):
             "line": None,
             "reason": "Please include some letters."
         }
+    return None
+
 
+def _line_check_messages(line, context):
     prompt = (
         "You review a single proposed sentence for a children's story.\n"
         "If it is meaningful and appropriate, return is_valid=true and the sentence with only minor typo fixes.\n"
@@ -273,29 +680,20 @@ def check_line(request, data: LineCheckSchema):
         "Do not add new information beyond minor fixes.\n\n"
     )
 
-    context = data.context or []
     if context:
         prompt += "Story so far:\n" + "\n".join(context) + "\n\n"
 
     prompt += f"Proposed line:\n{line}"
 
-    if not os.getenv("OPENAI_API_KEY"):
-        raise HttpError(500, "OPENAI_API_KEY not configured")
+    return [{
+        "role": "system",
+        "content": "You validate and lightly correct short story sentences."
+    }, {
+        "role": "user", "content": prompt
+    }]
 
-    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    response = client.responses.parse(
-        model=settings.AI_DEFAULT_MODEL,
-        input=[{
-            "role": "system",
-            "content": "You validate and lightly correct short story sentences."
-        }, {
-            "role": "user", "content": prompt
-        }],
-        text_format=LineCheckOptions,
-        **_openai_reasoning_params(),
-    )
 
+def _line_check_result(response):
     event = response.output_parsed
     cleaned_line = (event.line or "").strip()
 
@@ -313,44 +711,123 @@ def check_line(request, data: LineCheckSchema):
     }
 
 
-@router.post("/suggest-meta", response=StoryMetaResponse)
-def suggest_story_meta(request, data: SuggestSchema):
-    if not data.context:
-        return {
-            "title": "Untitled Story",
-            "tagline": "A tale waiting to be told."
-        }
+def check_line(request, data: LineCheckSchema):
+    line = (data.line or "").strip()
+    rejection = _line_check_rejection(line)
+    if rejection:
+        return rejection
 
-    prompt = (
-        "Generate a short title (max 8 words) and a short tagline (max 12 words) "
-        "for the following children's story. Return both in a structured format.\n\nStory:\n"
-    ) + "\n".join(data.context)
+    _require_openai_key()
+    response = openai_client.for_endpoint("check_line").responses.parse(
+        model=settings.AI_DEFAULT_MODEL,
+        input=_line_check_messages(line, data.context or []),
+        text_format=LineCheckOptions,
+        **_openai_reasoning_params(),
+    )
+    return _line_check_result(response)
 
-    if not os.getenv("OPENAI_API_KEY"):
-        raise HttpError(500, "OPENAI_API_KEY not configured")
 
-    client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async def acheck_line(request, data: LineCheckSchema):
+    line = (data.line or "").strip()
+    rejection = _line_check_rejection(line)
+    if rejection:
+        return rejection
 
-    response = client.responses.parse(
+    _require_openai_key()
+    response = await openai_client.for_endpoint_async("check_line").responses.parse(
         model=settings.AI_DEFAULT_MODEL,
-        input=[{
-            "role": "system",
-            "content": "You suggest catchy, kid-friendly story titles and taglines."
-        }, {
-            "role": "user", "content": prompt
-        }],
-        text_format=StoryMetaOptions,
+        input=_line_check_messages(line, data.context or []),
+        text_format=LineCheckOptions,
         **_openai_reasoning_params(),
     )
+    return _line_check_result(response)
+
+
+_DEFAULT_STORY_META = {
+    "title": "Untitled Story",
+    "tagline": "A tale waiting to be told."
+}
+
 
+def _story_meta_messages(context):
+    prompt = (
+        "Generate a short title (max 8 words) and a short tagline (max 12 words) "
+        "for the following children's story. Return both in a structured format.\n\nStory:\n"
+    ) + "\n".join(context)
+    return [{
+        "role": "system",
+        "content": "You suggest catchy, kid-friendly story titles and taglines."
+    }, {
+        "role": "user", "content": prompt
+    }]
+
+
+def _story_meta_result(response):
     event = response.output_parsed
 
     return {
-        "title": event.title.strip() if event.title else "Untitled Story",
-        "tagline": event.tagline.strip() if event.tagline else "A tale waiting to be told."
+        "title": event.title.strip() if event.title else _DEFAULT_STORY_META["title"],
+        "tagline": event.tagline.strip() if event.tagline else _DEFAULT_STORY_META["tagline"]
     }
 
 
+def suggest_story_meta(request, data: SuggestSchema):
+    if not data.context:
+        return _DEFAULT_STORY_META
+
+    messages = _story_meta_messages(data.context)
+
+    def generate():
+        _require_openai_key()
+        response = openai_client.for_endpoint("suggest_meta").responses.parse(
+            model=settings.AI_DEFAULT_MODEL,
+            input=messages,
+            text_format=StoryMetaOptions,
+            **_openai_reasoning_params(),
+        )
+        return _story_meta_result(response)
+
+    return suggestion_cache.get_or_generate(
+        "meta", settings.AI_DEFAULT_MODEL, messages, _openai_reasoning_params(), generate,
+        lock_timeout=openai_client.call_budget("suggest_meta"),
+    )
+
+
+async def asuggest_story_meta(request, data: SuggestSchema):
+    if not data.context:
+        return _DEFAULT_STORY_META
+
+    messages = _story_meta_messages(data.context)
+
+    async def generate():
+        _require_openai_key()
+        response = await openai_client.for_endpoint_async("suggest_meta").responses.parse(
+            model=settings.AI_DEFAULT_MODEL,
+            input=messages,
+            text_format=StoryMetaOptions,
+            **_openai_reasoning_params(),
+        )
+        return _story_meta_result(response)
+
+    return await suggestion_cache.aget_or_generate(
+        "meta", settings.AI_DEFAULT_MODEL, messages, _openai_reasoning_params(), generate,
+        lock_timeout=openai_client.call_budget("suggest_meta"),
+    )
+
+
+# The async views let one ASGI worker wait on many model calls at once.
+# Under WSGI every request would get its own event loop (and AI client),
+# so the sync views are served there.
+if settings.AI_ASYNC_VIEWS:
+    router.post("/suggest", response=List[str])(asuggest_lines)
+    router.post("/check-line", response=LineCheckResponse)(acheck_line)
+    router.post("/suggest-meta", response=StoryMetaResponse)(asuggest_story_meta)
+else:
+    router.post("/suggest", response=List[str])(suggest_lines)
+    router.post("/check-line", response=LineCheckResponse)(check_line)
+    router.post("/suggest-meta", response=StoryMetaResponse)(suggest_story_meta)
+
+
 @router.get("/config", response=StoryConfigResponse)
 def story_config(request):
     return {
@@ -359,37 +836,120 @@ def story_config(request):
     }
 
 
-@router.get("/{story_id}", response=StorySchema)
-def get_story(request, story_id: str):
+@router.get("/likes/mine", response=MyLikesResponse)
+def my_likes(request, response: HttpResponse, since: str | None = None):
+    """
+    Returns the UUIDs of the stories and lines the viewer likes, so story
+    payloads can stay user independent. With ``since`` (a previous
+    ``cursor``) only likes added after it are returned; removals need a full
+    fetch, which is cheap to revalidate through the ETag.
+    """
+    if not request.user.is_authenticated:
+        raise HttpError(401, "Authentication required")
+
+    story_since, line_since = 0, 0
+    if since:
+        try:
+            story_since, line_since = (int(part) for part in since.split("."))
+        except ValueError:
+            raise HttpError(400, "Invalid cursor")
+
+    liked = {}
+    cursor = []
+    for model, after in ((Story, story_since), (Line, line_since)):
+        rows = list(
+            model.liked_by.through.objects.filter(user_id=request.user.id, id__gt=after)
+            .order_by("id")
+            .values_list("id", f"{model._meta.model_name}__uuid")
+        )
+        liked[model._meta.model_name] = {str(obj_uuid) for _, obj_uuid in rows}
+        cursor.append(str(rows[-1][0] if rows else after))
+
+    if like_buffer.enabled():
+        pending = like_buffer.pending_for_user(request.user)
+        for model in (Story, Line):
+            name = model._meta.model_name
+            pks = {pk: is_liked for (kind, pk), is_liked in pending.items() if kind == name}
+            for pk, obj_uuid in model.objects.filter(pk__in=pks).values_list("pk", "uuid"):
+                if pks[pk]:
+                    liked[name].add(str(obj_uuid))
+                else:
+                    liked[name].discard(str(obj_uuid))
+
+    data = {
+        "stories": sorted(liked["story"]),
+        "lines": sorted(liked["line"]),
+        "cursor": ".".join(cursor),
+    }
+    etag = quote_etag(hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest())
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        return HttpResponseNotModified(headers={"ETag": etag})
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return data
+
+
+@router.get("/tree/{line_id}", response=StoryTreeSchema)
+def get_story_tree(request, line_id: str):
+    """
+    Returns the whole tree containing ``line_id`` (usually its root line)
+    with every node listed once.
+    """
     try:
-        story = Story.objects.get(uuid=story_id)
+        line = Line.objects.only("id", "root_id").get(uuid=line_id)
+    except (Line.DoesNotExist, ValidationError):
+        raise HttpError(404, "Line not found")
+
+    root_id = line.root_id or line.id
+    key = _tree_cache_key(root_id)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_story_tree(root_id)
+        cache.set(key, tree, settings.STORY_TREE_CACHE_TIMEOUT)
+    return tree
+
+
+def story_line_rows(story):
+    """
+    Returns the [uuid, text, is_manual] rows of the story's lines, from its
+    snapshot or, until it is backfilled, from the node cache
+    """
+    if story.lines_snapshot or not story.last_line_id:
+        return story.lines_snapshot
+    return line_snapshot(line_cache.get_ancestors(story.last_line_id, story.last_line.path))
+
+
+def build_story_payload(story_id: str, user):
+    stories = Story.objects.with_is_liked(user).select_related('last_line__author')
+    try:
+        story = stories.get(uuid=story_id)
     except Story.DoesNotExist:
         try:
-            story = Story.objects.get(id=story_id)
+            story = stories.get(id=story_id)
         except:
              raise HttpError(404, "Story not found")
 
-    # Build lines list (linked list traversal)
+    # Lines come from the frozen snapshot; only their likes are read, in one query
+    rows = story_line_rows(story)
+    likes = {
+        str(line_uuid): (pk, like_count, is_liked)
+        for pk, line_uuid, like_count, is_liked in Line.objects.filter(uuid__in=[row[0] for row in rows])
+        .with_is_liked(user)
+        .values_list("id", "uuid", "like_count", "is_liked")
+    }
+    pending_likes = like_buffer.pending_for_user(user) if like_buffer.enabled() else {}
     lines_data = []
-    curr = story.last_line
-    while curr:
-        # Check likes for each line
-        l_is_liked = False
-        if request.user.is_authenticated:
-            l_is_liked = curr.liked_by.filter(id=request.user.id).exists()
-            
-        lines_data.insert(0, {
-            "id": str(curr.uuid),
-            "text": curr.text,
-            "is_manual": curr.is_manual,
-            "like_count": curr.liked_by.count(),
-            "is_liked": l_is_liked
+    for line_uuid, text, is_manual in rows:
+        pk, like_count, is_liked = likes.get(line_uuid, (None, 0, False))
+        like_count, is_liked = like_buffer.overlay(Line, pk, like_count, is_liked, pending_likes)
+        lines_data.append({
+            "id": line_uuid,
+            "text": text,
+            "is_manual": is_manual,
+            "like_count": like_count,
+            "is_liked": is_liked
         })
-        curr = curr.previous
-
-    is_liked = False
-    if request.user.is_authenticated:
-        is_liked = story.liked_by.filter(id=request.user.id).exists()
+    story_like_count, story_is_liked = like_buffer.overlay(Story, story.pk, story.like_count, story.is_liked, pending_likes)
 
     author_name = get_author_display_name(story.last_line.author if story.last_line else None)
 
@@ -401,13 +961,38 @@ def get_story(request, story_id: str):
         "preview": story.tagline or "",
         "lines": lines_data,
         "created_at": story.created_at.isoformat() if story.created_at else "",
-        "length": len(lines_data),
+        "length": story.length,
         "author_name": author_name,
-        "like_count": story.liked_by.count(),
-        "is_liked": is_liked,
+        "like_count": story_like_count,
+        "is_liked": story_is_liked,
         "root_node_id": lines_data[0]['id'] if lines_data else None
     }
 
+
+@router.get("/{story_id}", response=StorySchema)
+def get_story(request, response: HttpResponse, story_id: str, shared: bool = False):
+    """
+    ``shared`` returns the anonymous payload, see ``_viewer``
+    """
+    user = _viewer(request, shared)
+    if _is_uuid(story_id):
+        story_uuid = uuid.UUID(story_id)
+        generation = response_cache.story_generation(story_uuid)
+        not_modified = _conditional_get(request, response, generation, user)
+        if not_modified:
+            return not_modified
+
+        # Anonymous responses are the same for everyone, so share them
+        if not user.is_authenticated:
+            return _render(response, get_or_compute(
+                response_cache.detail_key(story_uuid, generation),
+                lambda: build_story_payload(story_id, user),
+                settings.STORY_RESPONSE_CACHE_TIMEOUT,
+            ))
+
+    return _render(response, build_story_payload(story_id, user))
+
+
 @router.post("/", response=StoryResponse)
 def create_story(request, data: StoryCreateSchema):
     if not data.lines:
@@ -416,28 +1001,26 @@ def create_story(request, data: StoryCreateSchema):
     author = request.user if request.user.is_authenticated else None
 
     with transaction.atomic():
-        # 1. Reuse or Create Lines (Immutable Tree)
-        prev_line = None
-        for text in data.lines:
-            # Check if this exact line node exists in the tree
-            # (Same content AND same parent)
-            line, created = Line.objects.get_or_create(
-                text=text,
-                previous=prev_line,
-                defaults={
-                    'author': author,
-                    'is_manual': True
-                }
-            )
-            prev_line = line
-            
-        # 3. Create Story pointer
+        # 1. Reuse the existing prefix, create the rest (Immutable Tree)
+        lines = Line.objects.create_path(
+            data.lines,
+            author=author,
+            is_manual=True,
+        )
+        prev_line = lines[-1]
+
+        # 2. Create Story pointer, with the chain frozen into it
         story = Story.objects.create(
             title=data.title,
             tagline=data.tagline,
             last_line=prev_line,
+            lines_snapshot=line_snapshot(lines),
         )
-        
+
+    # New branches and story endings change the tree and the library
+    invalidate_story_tree(prev_line.root_id)
+    response_cache.bump_list()
+
     return {
         "id": str(story.uuid),
         "title": story.title,
@@ -467,6 +1050,10 @@ def update_story_meta(request, story_id: str, data: StoryMetaUpdateSchema):
 
     if fields_to_update:
         story.save(update_fields=fields_to_update)
+        response_cache.bump_stories(story.uuid)
+        response_cache.bump_list()
+        if "title" in fields_to_update and story.last_line:
+            invalidate_story_tree(story.last_line.root_id)
 
     return {
         "title": story.title,
@@ -479,62 +1066,99 @@ def delete_story(request, story_id: str):
         raise HttpError(401, "Authentication required")
 
     try:
-        story = Story.objects.get(uuid=story_id)
+        story = Story.objects.select_related("last_line").get(uuid=story_id)
     except Story.DoesNotExist:
         raise HttpError(404, "Story not found")
         
     # Check author via last_line
-    story_author = story.last_line.author if story.last_line else None
+    last_line = story.last_line
+    story_author_id = last_line.author_id if last_line else None
     
-    if story_author != request.user:
+    if story_author_id != request.user.id:
         raise HttpError(403, "You can only delete your own stories")
         
     story.delete()
+    if last_line:
+        invalidate_story_tree(last_line.root_id or last_line.id)
+    response_cache.bump_stories(story.uuid)
+    response_cache.bump_list()
     return {"success": True}
 
-@router.post("/{story_id}/like", response=LikeResponse)
-def like_story(request, story_id: str):
+def _get_story_for_like(request, story_id: str):
     if not request.user.is_authenticated:
         raise HttpError(401, "Authentication required")
-        
+
     try:
-        story = Story.objects.get(uuid=story_id)
+        return Story.objects.get(uuid=story_id)
     except Story.DoesNotExist:
         raise HttpError(404, "Story not found")
-        
-    if story.liked_by.filter(id=request.user.id).exists():
-        story.liked_by.remove(request.user)
-        is_liked = False
-    else:
-        story.liked_by.add(request.user)
-        is_liked = True
-        
-    return {
-        "success": True,
-        "like_count": story.liked_by.count(),
-        "is_liked": is_liked
-    }
 
-@router.post("/lines/{line_id}/like", response=LikeResponse)
-def like_line(request, line_id: str):
+def _get_line_for_like(request, line_id: str):
     if not request.user.is_authenticated:
         raise HttpError(401, "Authentication required")
-        
+
     try:
         # line_id is UUID string
-        line = Line.objects.get(uuid=line_id)
+        return Line.objects.get(uuid=line_id)
     except Line.DoesNotExist:
         raise HttpError(404, "Line not found")
-        
-    if line.liked_by.filter(id=request.user.id).exists():
-        line.liked_by.remove(request.user)
-        is_liked = False
-    else:
-        line.liked_by.add(request.user)
-        is_liked = True
-        
+
+@router.post("/{story_id}/like", response=LikeResponse)
+def like_story(request, story_id: str):
+    story = _get_story_for_like(request, story_id)
+    is_liked = toggle_like(story, request.user)
+
     return {
         "success": True,
-        "like_count": line.liked_by.count(),
+        "like_count": story.like_count,
         "is_liked": is_liked
     }
+
+@router.put("/{story_id}/like", response=LikeResponse)
+def put_story_like(request, story_id: str):
+    story = _get_story_for_like(request, story_id)
+    return {
+        "success": True,
+        "like_count": set_like(story, request.user, True),
+        "is_liked": True
+    }
+
+@router.delete("/{story_id}/like", response=LikeResponse)
+def delete_story_like(request, story_id: str):
+    story = _get_story_for_like(request, story_id)
+    return {
+        "success": True,
+        "like_count": set_like(story, request.user, False),
+        "is_liked": False
+    }
+
+@router.post("/lines/{line_id}/like", response=LikeResponse)
+def like_line(request, line_id: str):
+    line = _get_line_for_like(request, line_id)
+    is_liked = toggle_like(line, request.user)
+
+    return {
+        "success": True,
+        "like_count": line.like_count,
+        "is_liked": is_liked
+    }
+
+@router.put("/lines/{line_id}/like", response=LikeResponse)
+def put_line_like(request, line_id: str):
+    line = _get_line_for_like(request, line_id)
+    like_count = set_like(line, request.user, True)
+    return {
+        "success": True,
+        "like_count": like_count,
+        "is_liked": True
+    }
+
+@router.delete("/lines/{line_id}/like", response=LikeResponse)
+def delete_line_like(request, line_id: str):
+    line = _get_line_for_like(request, line_id)
+    like_count = set_like(line, request.user, False)
+    return {
+        "success": True,
+        "like_count": like_count,
+        "is_liked": False
+    }
@@ -0,0 +1,324 @@
+"""
+Cache helpers shared across the apps.
+"""
+import asyncio
+from collections import OrderedDict
+import math
+import pickle
+import random
+import threading
+import time
+
+from django.core.cache import cache as default_cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+def get_or_compute(key, compute, timeout, *, beta=1.0, lock_timeout=10, stale_timeout=None, cache=None):
+    """
+    Returns the cached value of ``key``, calling ``compute()`` to (re)build
+    it, with protection against cache stampedes:
+
+    - entries are recomputed a little before they expire, with a
+      probability that grows as expiry approaches and with how long the
+      last computation took ("probabilistic early expiration", tuned by
+      ``beta``)
+    - only the worker that wins a short cache lock recomputes; the others
+      keep serving the stale value meanwhile, which is kept around for
+      ``stale_timeout`` seconds after expiry (default: ``timeout``)
+    - when there is nothing to serve at all, the others wait up to
+      ``lock_timeout`` seconds for the winner's value before computing it
+      themselves; if the winner fails, one of them takes over right away
+    """
+    cache = cache or default_cache
+    locks = _lock_cache(cache)
+    lock_key = f"{key}:lock"
+    stale_timeout = timeout if stale_timeout is None else stale_timeout
+
+    entry = cache.get(key)
+    if entry is not None:
+        value = entry[0]
+        if _is_fresh(entry, beta):
+            return value
+        acquired = locks.add(lock_key, 1, lock_timeout)
+        if not acquired:
+            # Someone else is already recomputing
+            return value
+    else:
+        acquired = locks.add(lock_key, 1, lock_timeout)
+        deadline = time.monotonic() + lock_timeout
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is None and locks.get(lock_key) is None:
+                # Released: either just stored, or the winner failed and
+                # the first waiter to get the lock takes over
+                entry = cache.get(key)
+                if entry is None:
+                    acquired = locks.add(lock_key, 1, lock_timeout)
+            if entry is not None:
+                return entry[0]
+
+    try:
+        started = time.time()
+        value = compute()
+        finished = time.time()
+        cache.set(key, (value, finished - started, finished + timeout), timeout + stale_timeout)
+    finally:
+        if acquired:
+            locks.delete(lock_key)
+    return value
+
+
+async def aget_or_compute(key, compute, timeout, *, beta=1.0, lock_timeout=10, stale_timeout=None, cache=None):
+    """
+    ``get_or_compute`` for async views, where ``compute`` is a coroutine
+    function; entries and locks are shared with the sync version
+    """
+    cache = cache or default_cache
+    locks = _lock_cache(cache)
+    lock_key = f"{key}:lock"
+    stale_timeout = timeout if stale_timeout is None else stale_timeout
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        value = entry[0]
+        if _is_fresh(entry, beta):
+            return value
+        acquired = await locks.aadd(lock_key, 1, lock_timeout)
+        if not acquired:
+            return value
+    else:
+        acquired = await locks.aadd(lock_key, 1, lock_timeout)
+        deadline = time.monotonic() + lock_timeout
+        while not acquired and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await cache.aget(key)
+            if entry is None and await locks.aget(lock_key) is None:
+                entry = await cache.aget(key)
+                if entry is None:
+                    acquired = await locks.aadd(lock_key, 1, lock_timeout)
+            if entry is not None:
+                return entry[0]
+
+    try:
+        started = time.time()
+        value = await compute()
+        finished = time.time()
+        await cache.aset(key, (value, finished - started, finished + timeout), timeout + stale_timeout)
+    finally:
+        if acquired:
+            await locks.adelete(lock_key)
+    return value
+
+
+def _lock_cache(cache):
+    # Locks are polled, so a TieredCache's local copies would hide their
+    # release; they live on its shared tier only. (``default_cache`` is a
+    # proxy, hence no isinstance check.)
+    return getattr(cache, "shared", cache)
+
+
+def _is_fresh(entry, beta):
+    _, delta, expires_at = entry
+    return time.time() - delta * beta * math.log(1.0 - random.random()) < expires_at
+
+
+class LocalTier:
+    """
+    Bounded in-process LRU of pickled values, evicting the least recently
+    used entries once ``max_bytes`` (total pickled size) or ``max_entries``
+    is exceeded. Values are pickled so callers can't mutate cached objects.
+    """
+
+    def __init__(self, max_bytes, max_entries):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self.stats = {"local_hits": 0, "local_misses": 0, "shared_hits": 0, "shared_misses": 0}
+        self._entries = OrderedDict()  # key -> (pickled, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.stats["local_misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["local_hits"] += 1
+        return pickle.loads(entry[0])
+
+    def set(self, key, value, timeout):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._pop(key)
+            if len(pickled) > self.max_bytes:
+                return
+            self._entries[key] = (pickled, time.monotonic() + timeout)
+            self.size += len(pickled)
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+# Shared by every thread of the process, like LocMemCache's storage
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """
+    Cache backend keeping a per-process ``LocalTier`` in front of another
+    configured cache (the shared tier, e.g. file based or Redis).
+
+    Reads try the local tier first and copy shared hits into it; writes go
+    to both. Local copies live at most ``LOCAL_TIMEOUT`` seconds, which
+    bounds how long another worker's write or delete can go unnoticed.
+    ``add``/``incr``/``decr`` always run against the shared tier so locks
+    and counters stay atomic across workers.
+
+    OPTIONS:
+    - SHARED: alias of the shared tier in ``CACHES``
+    - LOCAL_TIMEOUT: seconds (default 5)
+    - LOCAL_MAX_BYTES: total pickled size of the local tier (default 32 MiB)
+    - LOCAL_MAX_ENTRIES: default 10000
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options["SHARED"]
+        self.local_timeout = options.get("LOCAL_TIMEOUT", 5)
+        with _local_tiers_lock:
+            self.local = _local_tiers.setdefault(
+                location or self._shared_alias,
+                LocalTier(
+                    max_bytes=options.get("LOCAL_MAX_BYTES", 32 * 1024 * 1024),
+                    max_entries=options.get("LOCAL_MAX_ENTRIES", 10000),
+                ),
+            )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def stats(self):
+        """
+        Returns this process's hit/miss counters per tier
+        """
+        return dict(self.local.stats)
+
+    def _local_key(self, key, version):
+        return self.shared.make_and_validate_key(key, version=version)
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _set_local(self, local_key, value, timeout):
+        local_timeout = self._local_timeout(timeout)
+        if local_timeout > 0:
+            self.local.set(local_key, value, local_timeout)
+        else:
+            self.local.delete(local_key)
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        value = self.local.get(local_key)
+        if value is not None:
+            return value
+        value = self.shared.get(key, version=version)
+        if value is None:
+            self.local.count("shared_misses")
+            return default
+        self.local.count("shared_hits")
+        self._set_local(local_key, value, None)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(self._local_key(key, version))
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key in missing:
+                if key in shared:
+                    self.local.count("shared_hits")
+                    self._set_local(self._local_key(key, version), shared[key], None)
+                else:
+                    self.local.count("shared_misses")
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, self._shared_timeout(timeout), version=version)
+        self._set_local(self._local_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, self._shared_timeout(timeout), version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._set_local(self._local_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.shared.add(key, value, self._shared_timeout(timeout), version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, self._shared_timeout(timeout), version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.shared.decr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def delete(self, key, version=None):
+        self.local.delete(self._local_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self._local_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def _shared_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
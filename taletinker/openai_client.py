@@ -0,0 +1,134 @@
+"""
+Process-wide OpenAI client.
+
+The client (and its HTTP connection pool) is created on first use and
+shared by every AI endpoint, so requests reuse warm keep-alive connections
+instead of paying a TLS handshake each time. Each endpoint gets its own
+timeout and retry budget from ``AI_ENDPOINT_OPTIONS``.
+
+Async views use ``for_endpoint_async``. Async connections are bound to an
+event loop, so there is one async client per running loop (a single one
+under an ASGI server).
+
+Connections must not be shared across processes, so the clients are
+dropped in forked children (e.g. gunicorn workers with ``--preload``) and
+rebuilt on their first use.
+"""
+import asyncio
+import os
+import threading
+import weakref
+
+from django.conf import settings
+import openai
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> client
+_lock = threading.Lock()
+
+# Callables building the clients in place of the OpenAI SDK (e.g. stubs for
+# the ``loadtest_ai_endpoints`` command); clients built earlier are kept
+# until ``reset``
+client_factory = None
+async_client_factory = None
+
+
+def _client_options():
+    # httpx or httpx2 types, depending on the SDK version
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=settings.AI_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.AI_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.AI_POOL_KEEPALIVE_EXPIRY,
+    )
+    options = {
+        "api_key": os.getenv("OPENAI_API_KEY"),
+        "timeout": _timeout(settings.AI_TIMEOUT),
+        "max_retries": settings.AI_MAX_RETRIES,
+    }
+    return options, limits
+
+
+def get_client():
+    """
+    Returns the shared client, creating it on first use
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None and client_factory is not None:
+                _client = client_factory()
+            elif _client is None:
+                options, limits = _client_options()
+                _client = openai.OpenAI(**options, http_client=openai.DefaultHttpxClient(limits=limits))
+    return _client
+
+
+def get_async_client():
+    """
+    Returns the async client of the running event loop, creating it on
+    first use
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None and async_client_factory is not None:
+        client = _async_clients[loop] = async_client_factory()
+    elif client is None:
+        options, limits = _client_options()
+        client = openai.AsyncOpenAI(**options, http_client=openai.DefaultAsyncHttpxClient(limits=limits))
+        _async_clients[loop] = client
+    return client
+
+
+def _endpoint_options(name):
+    options = settings.AI_ENDPOINT_OPTIONS.get(name, {})
+    return (
+        options.get("timeout", settings.AI_TIMEOUT),
+        options.get("max_retries", settings.AI_MAX_RETRIES),
+    )
+
+
+def _with_endpoint_options(client, name):
+    timeout, max_retries = _endpoint_options(name)
+    return client.with_options(timeout=_timeout(timeout), max_retries=max_retries)
+
+
+def call_budget(name) -> float:
+    """
+    Returns the longest a call to endpoint ``name`` may take, all retries
+    included (in seconds)
+    """
+    timeout, max_retries = _endpoint_options(name)
+    return timeout * (max_retries + 1)
+
+
+def for_endpoint(name):
+    """
+    Returns the shared client with the timeout and retry budget configured
+    for endpoint ``name``; the connection pool is the same
+    """
+    return _with_endpoint_options(get_client(), name)
+
+
+def for_endpoint_async(name):
+    """
+    ``for_endpoint`` for async views
+    """
+    return _with_endpoint_options(get_async_client(), name)
+
+
+def _timeout(total):
+    return type(openai.DEFAULT_TIMEOUT)(total, connect=settings.AI_CONNECT_TIMEOUT)
+
+
+def reset():
+    """
+    Forgets the shared clients without closing them, as their connections
+    may belong to the parent process
+    """
+    global _client, _async_clients, _lock
+    _client = None
+    _async_clients = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset)
@@ -17,10 +17,51 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Story creation defaults
 AI_DEFAULT_MODEL = os.getenv("AI_DEFAULT_MODEL", "gpt-5-nano")
 AI_REASONING_EFFORT = os.getenv("AI_REASONING_EFFORT", "").strip().lower() or None
+# Shared OpenAI client, see taletinker/openai_client.py
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "30"))
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", "5"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "1"))
+AI_ENDPOINT_OPTIONS = {
+    "suggest": {
+        "timeout": float(os.getenv("AI_SUGGEST_TIMEOUT", "20")),
+        "max_retries": int(os.getenv("AI_SUGGEST_MAX_RETRIES", "1")),
+    },
+    # Checked while the reader waits to add their line, so fail fast
+    "check_line": {
+        "timeout": float(os.getenv("AI_CHECK_LINE_TIMEOUT", "10")),
+        "max_retries": int(os.getenv("AI_CHECK_LINE_MAX_RETRIES", "0")),
+    },
+    "suggest_meta": {
+        "timeout": float(os.getenv("AI_SUGGEST_META_TIMEOUT", "20")),
+        "max_retries": int(os.getenv("AI_SUGGEST_META_MAX_RETRIES", "1")),
+    },
+}
+AI_POOL_MAX_CONNECTIONS = int(os.getenv("AI_POOL_MAX_CONNECTIONS", "20"))
+AI_POOL_MAX_KEEPALIVE = int(os.getenv("AI_POOL_MAX_KEEPALIVE", "10"))
+AI_POOL_KEEPALIVE_EXPIRY = float(os.getenv("AI_POOL_KEEPALIVE_EXPIRY", "60"))
+# Serve the AI endpoints as async views; enable when running under ASGI
+AI_ASYNC_VIEWS = os.getenv("AI_ASYNC_VIEWS", "false").lower() == "true"
 STORY_MIN_LINES = int(os.getenv("STORY_MIN_LINES", "5"))
 STORY_ANON_SIGNIN_LINE = int(os.getenv("STORY_ANON_SIGNIN_LINE", "3"))
 STORY_LINE_MIN_CHARS = int(os.getenv("STORY_LINE_MIN_CHARS", "8"))
 STORY_LINE_MIN_WORDS = int(os.getenv("STORY_LINE_MIN_WORDS", "2"))
+STORY_LIST_MAX_LIMIT = int(os.getenv("STORY_LIST_MAX_LIMIT", "100"))
+# Buffer likes in the cache and write them in batches (see flush_like_buffer)
+LIKE_BUFFER_ENABLED = os.getenv("LIKE_BUFFER_ENABLED", "false").lower() == "true"
+LIKE_BUFFER_CACHE = os.getenv("LIKE_BUFFER_CACHE", "default")
+STORY_RESPONSE_CACHE_TIMEOUT = int(os.getenv("STORY_RESPONSE_CACHE_TIMEOUT", "300"))
+STORY_TREE_CACHE_TIMEOUT = int(os.getenv("STORY_TREE_CACHE_TIMEOUT", "3600"))
+LINE_NODE_CACHE_SIZE = int(os.getenv("LINE_NODE_CACHE_SIZE", "100000"))
+# Serve story payloads without re-validating them against their schemas,
+# encoded with orjson (see requirements.txt) when it is installed
+STORY_FAST_RESPONSES = os.getenv("STORY_FAST_RESPONSES", "false").lower() == "true"
+# Stored AI suggestions, see taletinker/stories/suggestion_cache.py
+SUGGESTION_CACHE_TTL = int(os.getenv("SUGGESTION_CACHE_TTL", str(30 * 24 * 3600)))
+SUGGESTION_CACHE_FRONT_TIMEOUT = int(os.getenv("SUGGESTION_CACHE_FRONT_TIMEOUT", "3600"))
+SUGGESTION_CACHE_MAX_ENTRIES = int(os.getenv("SUGGESTION_CACHE_MAX_ENTRIES", "100000"))
+SUGGESTION_CACHE_EVICT_EVERY = int(os.getenv("SUGGESTION_CACHE_EVICT_EVERY", "100"))
+# "reuse" offers existing human continuations of a node before asking the model
+SUGGESTION_STRATEGY = os.getenv("SUGGESTION_STRATEGY", "model")
 
 NOTIFY_ON_SIGNUP = os.getenv("NOTIFY_ON_SIGNUP", "true").lower() == "true"
 
@@ -263,9 +304,31 @@ AUTHENTICATION_BACKENDS = [
 SESAME_MAX_AGE = 300
 
 if not DEBUG:
-    CACHES = {
-        'default': {
+    # Per-process LRU in front of a shared tier picked by CACHE_SHARED_BACKEND;
+    # "redis" needs the redis package and CACHE_REDIS_URL
+    SHARED_CACHES = {
+        'file': {
             'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
             'LOCATION': BASE_DIR / 'cache',
-        }
+        },
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'redis': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+        },
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'taletinker.cache.TieredCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'LOCAL_TIMEOUT': int(os.getenv('CACHE_LOCAL_TIMEOUT', '5')),
+                'LOCAL_MAX_BYTES': int(os.getenv('CACHE_LOCAL_MAX_BYTES', str(32 * 1024 * 1024))),
+            },
+        },
+        'shared': SHARED_CACHES[os.getenv('CACHE_SHARED_BACKEND', 'file')],
     }
+    # Buffered likes are read-modify-written, so skip the local tier
+    LIKE_BUFFER_CACHE = os.getenv("LIKE_BUFFER_CACHE", "shared")
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Line, Story
+from .models import CachedSuggestion, Line, Story
 
 
 @admin.register(Line)
@@ -17,7 +17,24 @@ class LineAdmin(admin.ModelAdmin):
 
 @admin.register(Story)
 class StoryAdmin(admin.ModelAdmin):
-    list_display = ("uuid", "title", "tagline", "last_line", "created_at")
+    list_display = ("uuid", "title", "tagline", "opening", "last_line", "created_at")
     search_fields = ("title", "tagline", "last_line__text")
     list_filter = ("created_at",)
     readonly_fields = ("uuid", "created_at")
+
+    def get_queryset(self, request):
+        # Loads the lines of the whole page at once for ``opening``
+        return super().get_queryset(request).with_lines()
+
+    @admin.display(description="opening")
+    def opening(self, obj):
+        lines = obj.get_lines
+        text = lines[0].text if lines else ""
+        return (text[:75] + "…") if len(text) > 75 else text
+
+
+@admin.register(CachedSuggestion)
+class CachedSuggestionAdmin(admin.ModelAdmin):
+    list_display = ("key", "kind", "hits", "created_at", "last_used_at")
+    list_filter = ("kind",)
+    readonly_fields = ("key", "kind", "payload", "hits", "created_at", "last_used_at")
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class StoriesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "taletinker.stories"
+
+    def ready(self):
+        from taletinker.stories import like_buffer
+
+        checks.register(like_buffer.check_cache, checks.Tags.caches)
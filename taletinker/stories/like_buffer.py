@@ -0,0 +1,192 @@
+"""
+Write-behind buffer for likes.
+
+When ``LIKE_BUFFER_ENABLED`` is on, like/unlike intents are stored in the
+``LIKE_BUFFER_CACHE`` cache instead of being written straight to the
+database. Intents are coalesced per (user, target), so only the last one
+counts, and the ``flush_like_buffer`` command applies them in one bulk
+transaction. Reads overlay the viewer's pending intents so their own likes
+show up immediately.
+
+The shared cache must be visible to every worker (e.g. a Redis-compatible
+server); a per-process cache would only buffer each worker's own intents.
+Each user's intents have their own lock, built on ``cache.add``, so the
+cache must add atomically (the file based cache doesn't, see
+``check_cache``).
+"""
+from contextlib import contextmanager
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import transaction
+
+from taletinker.stories.models import Line, Story
+
+MODELS = {model._meta.model_name: model for model in (Story, Line)}
+
+_USERS_KEY = "likes:pending_users"
+_USERS_LOCK_KEY = "likes:lock:users"
+
+
+class LikeBufferBusy(Exception):
+    """
+    The buffer lock could not be acquired in time
+    """
+
+
+def enabled() -> bool:
+    return settings.LIKE_BUFFER_ENABLED
+
+
+def _cache():
+    return caches[settings.LIKE_BUFFER_CACHE]
+
+
+def _user_key(user_id) -> str:
+    return f"likes:pending:{user_id}"
+
+
+def _user_lock_key(user_id) -> str:
+    return f"likes:lock:{user_id}"
+
+
+@contextmanager
+def _locked(lock_key, wait=2.0):
+    cache = _cache()
+    deadline = time.monotonic() + wait
+    while not cache.add(lock_key, 1, timeout=10):
+        if time.monotonic() > deadline:
+            raise LikeBufferBusy()
+        time.sleep(0.005)
+    try:
+        yield cache
+    finally:
+        cache.delete(lock_key)
+
+
+def check_cache(app_configs, **kwargs):
+    """
+    System check: the buffer's locks rely on an atomic ``cache.add``, which
+    the file based cache doesn't provide
+    """
+    if not settings.LIKE_BUFFER_ENABLED:
+        return []
+    cache = caches[settings.LIKE_BUFFER_CACHE]
+    cache = getattr(cache, "shared", cache)
+    if not isinstance(cache, FileBasedCache):
+        return []
+    return [checks.Warning(
+        "LIKE_BUFFER_ENABLED is on but LIKE_BUFFER_CACHE is a file based cache, "
+        "whose add() is not atomic; concurrent likes may be lost.",
+        hint="Use a Redis-compatible cache (CACHE_SHARED_BACKEND=redis).",
+        id="stories.W001",
+    )]
+
+
+def pending_for_user(user) -> dict:
+    """
+    Returns the user's pending intents as {(model_name, pk): liked}
+    """
+    if not user.is_authenticated:
+        return {}
+    return _cache().get(_user_key(user.id)) or {}
+
+
+def record(obj, user, liked):
+    """
+    Buffers ``user`` liking (or unliking) ``obj``, replacing any earlier
+    pending intent for the same target
+    """
+    # Only the user's own intents are locked, so users don't contend
+    with _locked(_user_lock_key(user.id)) as cache:
+        intents = cache.get(_user_key(user.id)) or {}
+        intents[(obj._meta.model_name, obj.pk)] = liked
+        cache.set(_user_key(user.id), intents, timeout=None)
+    # Checked after writing, so a flush in between re-registers the user
+    if user.id not in (cache.get(_USERS_KEY) or set()):
+        _add_users({user.id})
+
+
+def _add_users(user_ids):
+    with _locked(_USERS_LOCK_KEY) as cache:
+        users = cache.get(_USERS_KEY) or set()
+        users.update(user_ids)
+        cache.set(_USERS_KEY, users, timeout=None)
+
+
+def overlay(model, pk, like_count, is_liked, pending):
+    """
+    Applies a pending intent from ``pending_for_user`` to the stored
+    ``like_count``/``is_liked`` of row ``pk`` of ``model``
+    """
+    liked = pending.get((model._meta.model_name, pk))
+    if liked is None or liked == is_liked:
+        return like_count, is_liked
+    return like_count + (1 if liked else -1), liked
+
+
+def flush():
+    """
+    Applies every pending intent in one transaction and returns the
+    affected targets as {model_name: set of pks}
+    """
+    with _locked(_USERS_LOCK_KEY) as cache:
+        users = cache.get(_USERS_KEY) or set()
+        cache.delete(_USERS_KEY)
+    pending = {}
+    for user_id in users:
+        with _locked(_user_lock_key(user_id)) as cache:
+            intents = cache.get(_user_key(user_id))
+            cache.delete(_user_key(user_id))
+        if intents:
+            pending[user_id] = intents
+
+    try:
+        return _apply(pending)
+    except Exception:
+        # Put the intents back, letting newer ones for the same target win
+        for user_id, intents in pending.items():
+            with _locked(_user_lock_key(user_id)) as cache:
+                merged = {**intents, **(cache.get(_user_key(user_id)) or {})}
+                cache.set(_user_key(user_id), merged, timeout=None)
+        _add_users(pending)
+        raise
+
+
+def _apply(pending):
+    likes = {name: [] for name in MODELS}
+    unlikes = {name: {} for name in MODELS}
+    for user_id, intents in pending.items():
+        for (model_name, pk), liked in intents.items():
+            if liked:
+                likes[model_name].append((pk, user_id))
+            else:
+                unlikes[model_name].setdefault(user_id, []).append(pk)
+
+    affected = {}
+    with transaction.atomic():
+        for model_name, model in MODELS.items():
+            through = model.liked_by.through
+            field = f"{model_name}_id"
+            # Targets deleted since the like was buffered would fail the
+            # foreign key (which ignore_conflicts doesn't cover), so drop them
+            existing = set(
+                model.objects.filter(pk__in={pk for pk, _ in likes[model_name]}).values_list("pk", flat=True)
+            )
+            likes[model_name] = [(pk, user_id) for pk, user_id in likes[model_name] if pk in existing]
+            through.objects.bulk_create(
+                [through(**{field: pk, "user_id": user_id}) for pk, user_id in likes[model_name]],
+                ignore_conflicts=True,
+            )
+            for user_id, pks in unlikes[model_name].items():
+                through.objects.filter(**{f"{field}__in": pks}, user_id=user_id).delete()
+
+            pks = {pk for pk, _ in likes[model_name]}
+            pks.update(pk for user_pks in unlikes[model_name].values() for pk in user_pks)
+            if pks:
+                model.objects.filter(pk__in=pks).recount_likes()
+                affected[model_name] = pks
+    return affected
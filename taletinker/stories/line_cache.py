@@ -0,0 +1,130 @@
+"""
+Process-wide cache of Line nodes.
+
+Lines are never edited once created (the tree only grows), so their
+immutable columns can be cached without any invalidation. Walking a chain
+from its last line to the root then costs no queries once the nodes are
+warm; missing nodes are fetched in batches, using the materialized path to
+fetch a whole chain at once.
+
+Mutable data (likes, the author of claimed candidates) is not part of the
+nodes and must be read separately.
+"""
+from collections import OrderedDict, namedtuple
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from taletinker.stories.models import Line
+
+LineNode = namedtuple("LineNode", "id uuid parent_id text is_manual")
+
+_FIELDS = ("id", "uuid", "previous_id", "text", "is_manual")
+
+_nodes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _get(pk):
+    with _lock:
+        node = _nodes.get(pk)
+        if node is not None:
+            _nodes.move_to_end(pk)
+        return node
+
+
+def _put(nodes):
+    with _lock:
+        for node in nodes:
+            _nodes[node.id] = node
+            _nodes.move_to_end(node.id)
+        while len(_nodes) > settings.LINE_NODE_CACHE_SIZE:
+            _nodes.popitem(last=False)
+
+
+def clear():
+    with _lock:
+        _nodes.clear()
+
+
+def _fetch(ids):
+    """
+    Loads the nodes ``ids`` and returns them along with the ids of their
+    ancestors (from the path, or just the parent if it is not backfilled)
+    """
+    nodes = {}
+    ancestor_ids = set()
+    for *fields, path in Line.objects.filter(pk__in=ids).values_list(*_FIELDS, "path"):
+        node = LineNode(*fields)
+        nodes[node.id] = node
+        if path:
+            ancestor_ids.update(_path_ids(path))
+        elif node.parent_id is not None:
+            ancestor_ids.add(node.parent_id)
+    # Nodes read inside a write transaction may still be rolled back (and
+    # their ids reused), so they are only cached once it commits
+    transaction.on_commit(lambda: _put(nodes.values()))
+    return nodes, ancestor_ids
+
+
+def _walk(pk, known):
+    """
+    Follows cached parents from ``pk`` into ``known``, returning the first
+    id that is not cached (or None once the root is reached)
+    """
+    while pk is not None and pk not in known:
+        node = _get(pk)
+        if node is None:
+            return pk
+        known[pk] = node
+        pk = node.parent_id
+    return None
+
+
+def _path_ids(path):
+    return [int(pk) for pk in path.split("/") if pk]
+
+
+def get_ancestors_many(line_ids, paths=None):
+    """
+    Returns {line_id: [LineNode, ...]} with the nodes from the root down to
+    each line (inclusive); unknown ids map to an empty list. ``paths`` maps
+    line ids to their materialized path when the caller already has it,
+    which saves a round trip on a cold cache.
+    """
+    paths = paths or {}
+    known = {}
+    missing = set()
+    for pk in line_ids:
+        if paths.get(pk):
+            missing.update(_walk(ancestor, known) for ancestor in _path_ids(paths[pk]))
+        else:
+            missing.add(_walk(pk, known))
+    missing.discard(None)
+
+    # A single round trip is enough with backfilled paths
+    fetched = set()
+    while missing:
+        nodes, ancestor_ids = _fetch(missing)
+        known.update(nodes)
+        fetched |= missing
+        missing = {_walk(pk, known) for pk in ancestor_ids} - {None} - fetched
+
+    chains = {}
+    for pk in line_ids:
+        chain = []
+        node = known.get(pk)
+        while node is not None:
+            chain.append(node)
+            node = known.get(node.parent_id)
+        chain.reverse()
+        chains[pk] = chain
+    return chains
+
+
+def get_ancestors(line_id, path=""):
+    """
+    Returns the nodes from the root down to ``line_id`` (inclusive)
+    """
+    return get_ancestors_many([line_id], {line_id: path})[line_id]
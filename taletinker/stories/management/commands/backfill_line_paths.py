@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from taletinker.stories.models import Line
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the materialized ancestry (path, depth, root) of every Line"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        parents = dict(Line.objects.values_list("id", "previous_id"))
+        paths = {}
+
+        def path_for(pk):
+            # Iterative so deep chains do not hit the recursion limit
+            chain = []
+            while pk is not None and pk not in paths:
+                chain.append(pk)
+                pk = parents.get(pk)
+            prefix = paths.get(pk, "")
+            for node in reversed(chain):
+                prefix = f"{prefix}{node}/"
+                paths[node] = prefix
+            return prefix
+
+        to_update = []
+        for line in Line.objects.only("id", "path", "depth", "root_id").iterator():
+            path = path_for(line.id)
+            ids = path.split("/")[:-1]
+            depth, root_id = len(ids) - 1, int(ids[0])
+            if (line.path, line.depth, line.root_id) != (path, depth, root_id):
+                line.path, line.depth, line.root_id = path, depth, root_id
+                to_update.append(line)
+
+        Line.objects.bulk_update(to_update, ["path", "depth", "root"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Updated {len(to_update)} lines."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from taletinker.stories import line_cache
+from taletinker.stories.models import Story, line_snapshot
+
+
+class Command(BaseCommand):
+    help = "Freezes the lines of every Story without a snapshot into Story.lines_snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        updated = 0
+        last_pk = 0
+        while True:
+            stories = list(
+                Story.objects.filter(pk__gt=last_pk, lines_snapshot=[], last_line__isnull=False)
+                .select_related("last_line")
+                .only("id", "lines_snapshot", "last_line__id", "last_line__path")
+                .order_by("pk")[:batch_size]
+            )
+            if not stories:
+                break
+            chains = line_cache.get_ancestors_many(
+                [story.last_line_id for story in stories],
+                {story.last_line_id: story.last_line.path for story in stories},
+            )
+            for story in stories:
+                story.lines_snapshot = line_snapshot(chains[story.last_line_id])
+            Story.objects.bulk_update(stories, ["lines_snapshot"])
+            updated += len(stories)
+            last_pk = stories[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Froze the lines of {updated} stories."))
@@ -0,0 +1,88 @@
+import json
+import time
+import uuid
+from typing import List
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from ninja.responses import NinjaJSONEncoder
+from pydantic import TypeAdapter
+
+from taletinker import api_stories
+from taletinker.api_stories import StoryListSchema
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the validated (pydantic) and fast (STORY_FAST_RESPONSES) paths "
+        "of serializing a list_stories payload"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stories", type=int, default=10000)
+        parser.add_argument("--lines", type=int, default=8)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        payload = self._payload(options["stories"], options["lines"])
+        adapter = TypeAdapter(List[StoryListSchema])
+
+        def validated():
+            # What ninja does with a response schema and exclude_unset=True
+            data = adapter.dump_python(adapter.validate_python(payload), by_alias=True, exclude_unset=True)
+            return json.dumps(data, cls=NinjaJSONEncoder).encode()
+
+        def fast():
+            if api_stories.orjson:
+                return api_stories.orjson.dumps(payload)
+            return json.dumps(payload, separators=(",", ":")).encode()
+
+        if json.loads(validated()) != json.loads(fast()):
+            raise AssertionError("The two paths render different payloads")
+
+        timings = {}
+        for name, render in (("validated", validated), ("fast", fast)):
+            best = None
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                render()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+            self.stdout.write(f"{name:>9}: {best * 1000:.1f} ms")
+
+        encoder = "orjson" if api_stories.orjson else "json"
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['stories']} stories: fast path ({encoder}) is "
+            f"{timings['validated'] / timings['fast']:.1f}x faster"
+        ))
+
+    def _payload(self, stories, lines):
+        created_at = timezone.now().isoformat()
+        payload = []
+        for pk in range(stories, 0, -1):
+            story_lines = [
+                {
+                    "id": str(uuid.uuid4()),
+                    "text": f"Line {index} of story {pk}, long enough to look like a real sentence.",
+                    "is_manual": True,
+                    "like_count": 0,
+                    "is_liked": False,
+                }
+                for index in range(lines)
+            ]
+            payload.append({
+                "id": pk,
+                "uuid": str(uuid.uuid4()),
+                "is_liked": False,
+                "like_count": pk % 7,
+                "lines": story_lines,
+                "title": f"Story {pk}",
+                "tagline": "A tale",
+                "preview": "A tale",
+                "created_at": created_at,
+                "length": lines,
+                "author_name": "a***@example.com",
+                "root_node_id": story_lines[0]["id"],
+            })
+        return payload
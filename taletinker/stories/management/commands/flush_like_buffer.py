@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from taletinker.api_stories import invalidate_likes
+from taletinker.stories import like_buffer
+from taletinker.stories.models import Line, Story
+
+
+class Command(BaseCommand):
+    help = "Writes the buffered like/unlike intents to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=0,
+            help="Keep running and flush every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            affected = like_buffer.flush()
+            for model in (Story, Line):
+                for obj in model.objects.filter(pk__in=affected.get(model._meta.model_name, ())):
+                    invalidate_likes(obj)
+
+            total = sum(len(pks) for pks in affected.values())
+            if total or not options["interval"]:
+                self.stdout.write(f"Flushed likes for {total} targets.")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+from taletinker import openai_client
+
+
+class _StubClient:
+    """
+    Stands in for the OpenAI client, answering after ``latency`` seconds
+    """
+
+    def __init__(self, latency, is_async):
+        self.latency = latency
+        self.responses = SimpleNamespace(parse=self._aparse if is_async else self._parse)
+
+    def with_options(self, **kwargs):
+        return self
+
+    @staticmethod
+    def _answer():
+        return SimpleNamespace(output_parsed=SimpleNamespace(is_valid=True, line="The cat sat on the mat.", reason=""))
+
+    def _parse(self, **kwargs):
+        time.sleep(self.latency)
+        return self._answer()
+
+    async def _aparse(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._answer()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the throughput of POST /api/stories/check-line through the "
+        "ASGI stack (middleware, routing, ninja) in one event loop, against a "
+        "stubbed model with fixed latency (no OpenAI calls). Serves the async "
+        "view with AI_ASYNC_VIEWS=true and the sync one otherwise; run it with "
+        "both to compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--latency", type=float, default=0.5, help="Simulated model latency in seconds")
+        parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight at once")
+
+    def handle(self, *args, **options):
+        count, latency = options["requests"], options["latency"]
+        openai_client.client_factory = lambda: _StubClient(latency, is_async=False)
+        openai_client.async_client_factory = lambda: _StubClient(latency, is_async=True)
+        openai_client.reset()
+        had_key = "OPENAI_API_KEY" in os.environ
+        os.environ.setdefault("OPENAI_API_KEY", "load-test")
+        try:
+            # The test client's requests are for "testserver"
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                elapsed, statuses = asyncio.run(self._run(count, options["concurrency"]))
+        finally:
+            openai_client.client_factory = openai_client.async_client_factory = None
+            openai_client.reset()
+            if not had_key:
+                del os.environ["OPENAI_API_KEY"]
+
+        failed = sum(status != 200 for status in statuses)
+        if failed:
+            raise AssertionError(f"{failed} of {count} requests failed")
+        # Under ASGI, Django runs everything inside a sync-only middleware on
+        # a single thread, which serializes the requests even for async views
+        sync_only = [path for path in settings.MIDDLEWARE if not getattr(import_string(path), "async_capable", False)]
+        if sync_only:
+            self.stdout.write(self.style.WARNING(f"Sync-only middleware: {', '.join(sync_only)}"))
+        view = "async" if settings.AI_ASYNC_VIEWS else "sync"
+        self.stdout.write(self.style.SUCCESS(
+            f"{view} view: {count / elapsed:.1f} req/s ({elapsed:.2f} s for {count} requests "
+            f"with {latency}s model latency)"
+        ))
+
+    async def _run(self, count, concurrency):
+        # AsyncClient runs requests through Django's ASGI handler, as
+        # taletinker.asgi.application does
+        client = AsyncClient()
+        data = {"line": "The cat sat on teh mat.", "context": ["Once upon a time"]}
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def post():
+            async with in_flight:
+                response = await client.post("/api/stories/check-line", data, content_type="application/json")
+                return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(post() for _ in range(count)))
+        return time.perf_counter() - started, statuses
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from taletinker.stories import suggestion_cache
+
+
+class Command(BaseCommand):
+    help = "Deletes expired stored AI suggestions and trims the rest to SUGGESTION_CACHE_MAX_ENTRIES"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Delete every stored suggestion")
+
+    def handle(self, *args, **options):
+        deleted = suggestion_cache.purge(everything=options["all"])
+        stats = suggestion_cache.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} suggestions. Hit rate {stats['hit_rate']:.0%} "
+            f"({stats['front_hits']} cache, {stats['db_hits']} database, {stats['misses']} misses)."
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from taletinker.stories.models import Line, Story
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized like_count of every Story and Line from liked_by"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model in (Story, Line):
+            fixed = self.reconcile(model, options["batch_size"])
+            self.stdout.write(f"{model._meta.verbose_name_plural}: fixed {fixed} like counts")
+        self.stdout.write(self.style.SUCCESS("Like counts reconciled."))
+
+    def reconcile(self, model, batch_size):
+        fixed = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .annotate(actual=Count("liked_by"))
+                .values_list("pk", "like_count", "actual")[:batch_size]
+            )
+            if not rows:
+                return fixed
+            drifted = [pk for pk, like_count, actual in rows if like_count != actual]
+            if drifted:
+                model.objects.filter(pk__in=drifted).recount_likes()
+            fixed += len(drifted)
+            last_pk = rows[-1][0]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0011_rename_end_story_last_line_remove_story_author_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='line',
+            name='path',
+            field=models.TextField(blank=True, db_index=True, default=''),
+        ),
+    ]
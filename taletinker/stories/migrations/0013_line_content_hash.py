@@ -0,0 +1,97 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def _line_hash(parent_hash, text):
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{parent_hash}:{normalized}".encode()).hexdigest()
+
+
+def backfill_hashes(apps, schema_editor):
+    """
+    Hashes every line and merges duplicate siblings (same parent, same
+    normalized text) into the oldest one, moving children, stories and likes.
+    """
+    Line = apps.get_model("stories", "Line")
+    Story = apps.get_model("stories", "Story")
+    LineLike = Line.liked_by.through
+
+    rows = {pk: (previous_id, text) for pk, previous_id, text in Line.objects.values_list("id", "previous_id", "text")}
+    canonical = {}  # line id -> id of the line it is merged into
+    hashes = {}  # canonical line id -> hash
+    seen = {}  # hash -> canonical line id
+
+    def resolve(pk):
+        chain = []
+        while pk is not None and pk not in canonical:
+            chain.append(pk)
+            pk = rows[pk][0]
+        for node in reversed(chain):
+            previous_id, text = rows[node]
+            parent_hash = hashes[canonical[previous_id]] if previous_id is not None else ""
+            content_hash = _line_hash(parent_hash, text)
+            if content_hash in seen:
+                canonical[node] = seen[content_hash]
+            else:
+                seen[content_hash] = canonical[node] = node
+                hashes[node] = content_hash
+
+    for pk in sorted(rows):
+        resolve(pk)
+
+    duplicates = {pk: target for pk, target in canonical.items() if pk != target}
+    paths = {}
+
+    def path_for(pk):
+        chain = []
+        while pk is not None and pk not in paths:
+            chain.append(pk)
+            pk = canonical.get(rows[pk][0]) if rows[pk][0] is not None else None
+        prefix = paths.get(pk, "")
+        for node in reversed(chain):
+            prefix = paths[node] = f"{prefix}{node}/"
+        return prefix
+
+    to_update = []
+    for line in Line.objects.exclude(id__in=duplicates).only("id", "previous_id", "path"):
+        previous_id = canonical[line.previous_id] if line.previous_id is not None else None
+        line.previous_id = previous_id
+        line.content_hash = hashes[line.id]
+        line.path = path_for(line.id)
+        to_update.append(line)
+    Line.objects.bulk_update(to_update, ["previous", "content_hash", "path"], batch_size=500)
+
+    for duplicate, target in duplicates.items():
+        Story.objects.filter(last_line_id=duplicate).update(last_line_id=target)
+        LineLike.objects.bulk_create(
+            [
+                LineLike(line_id=target, user_id=user_id)
+                for user_id in LineLike.objects.filter(line_id=duplicate).values_list("user_id", flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+    # Surviving children were repointed above, so the duplicates can go
+    Line.objects.filter(id__in=duplicates).update(previous=None)
+    Line.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0012_line_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='line',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_hashes, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='line',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-17 01:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_depth_root(apps, schema_editor):
+    Line = apps.get_model("stories", "Line")
+    lines = list(Line.objects.exclude(path="").only("id", "path"))
+    for line in lines:
+        ids = [int(pk) for pk in line.path.split("/") if pk]
+        line.depth = len(ids) - 1
+        line.root_id = ids[0]
+    Line.objects.bulk_update(lines, ["depth", "root"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0013_line_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='line',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='line',
+            name='root',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='tree_lines', to='stories.line'),
+        ),
+        migrations.RunPython(backfill_depth_root, reverse_code=migrations.RunPython.noop),
+    ]
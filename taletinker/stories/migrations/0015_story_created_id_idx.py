@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 01:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0014_line_depth_root'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['-created_at', '-id'], name='story_created_id_idx'),
+        ),
+    ]
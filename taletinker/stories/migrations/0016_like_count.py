@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 01:57
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_like_counts(apps, schema_editor):
+    for model_name in ("Line", "Story"):
+        model = apps.get_model("stories", model_name)
+        field = model_name.lower()
+        counts = (
+            model.liked_by.through.objects.values(field)
+            .annotate(count=Count("id"))
+            .values_list(field, "count")
+        )
+        for pk, count in counts:
+            model.objects.filter(pk=pk).update(like_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0015_story_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='line',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_like_counts, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0016_like_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='lines_snapshot',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
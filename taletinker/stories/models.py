@@ -1,14 +1,221 @@
 from functools import cached_property
+import hashlib
 
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 import uuid
 
 
+def normalize_line_text(text):
+    return " ".join(text.split())
+
+
+def line_hash(parent_hash, text):
+    """
+    Identity of a node in the immutable tree: its parent's hash chained with
+    its own normalized text
+    """
+    return hashlib.sha256(f"{parent_hash}:{normalize_line_text(text)}".encode()).hexdigest()
+
+
+class LikedByQuerySetMixin:
+    """
+    Like annotations for models with a ``liked_by`` relation, so listings
+    stay at a constant number of queries. The counts themselves are kept in
+    the ``like_count`` column.
+    """
+
+    def with_is_liked(self, user):
+        if user is None or not user.is_authenticated:
+            return self.annotate(is_liked=Value(False))
+        likes = self.model.liked_by.through.objects.filter(
+            **{self.model._meta.model_name: OuterRef("pk")},
+            user=user,
+        )
+        return self.annotate(is_liked=Exists(likes))
+
+    def set_liked(self, pk, user, liked):
+        """
+        Idempotently likes (or unlikes) row ``pk`` for ``user`` with a single
+        INSERT ... ON CONFLICT DO NOTHING (or DELETE), adjusting ``like_count``
+        only when a row actually changed. Returns the new like count.
+        """
+        through = self.model.liked_by.through
+        field = self.model._meta.model_name
+        with transaction.atomic(using=self.db):
+            if liked:
+                connection = connections[self.db]
+                quote = connection.ops.quote_name
+                sql = "INSERT INTO {} ({}, {}) VALUES (%s, %s) ON CONFLICT DO NOTHING".format(
+                    quote(through._meta.db_table),
+                    quote(through._meta.get_field(field).column),
+                    quote(through._meta.get_field("user").column),
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [pk, user.pk])
+                    changed = cursor.rowcount
+            else:
+                changed, _ = through.objects.filter(**{field: pk}, user=user).delete()
+
+            if changed:
+                delta = 1 if liked else -1
+                self.filter(pk=pk).update(like_count=F("like_count") + delta)
+            return self.filter(pk=pk).values_list("like_count", flat=True).get()
+
+    def recount_likes(self):
+        """
+        Recomputes ``like_count`` from ``liked_by`` for every row of the
+        queryset; the count happens inside the UPDATE so concurrent likes
+        are not lost
+        """
+        field = self.model._meta.model_name
+        actual_count = Subquery(
+            self.model.liked_by.through.objects.filter(**{field: OuterRef("pk")})
+            .values(field)
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return self.update(like_count=Coalesce(actual_count, 0))
+
+
+class LineQuerySet(LikedByQuerySetMixin, models.QuerySet):
+    def path_to(self, line):
+        """
+        Returns the lines from the root down to ``line`` (inclusive), in order,
+        using the materialized path so the whole chain loads in one query.
+        """
+        if line is None:
+            return []
+        ids = line.ancestor_ids
+        if not ids:
+            # Not backfilled yet, fall back to walking the chain
+            lines = []
+            while line:
+                lines.insert(0, line)
+                line = line.previous
+            return lines
+        by_id = self.in_bulk(ids)
+        return [by_id[pk] for pk in ids if pk in by_id]
+
+    def with_descendant_count(self):
+        """
+        Annotates ``descendant_count``, the number of lines below each line
+        """
+        subtree = (
+            self.model.objects.filter(root_id=OuterRef("root_id"), path__startswith=OuterRef("path"))
+            .exclude(pk=OuterRef("pk"))
+            .order_by()
+            .values("root_id")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return self.annotate(descendant_count=Coalesce(Subquery(subtree), 0))
+
+    def create_chain(self, texts, **defaults):
+        """
+        Returns the last line of the chain ``texts``, see ``create_path``
+        """
+        return self.create_path(texts, **defaults)[-1]
+
+    def create_path(self, texts, **defaults):
+        """
+        Returns the lines of the chain ``texts``, reusing every node that
+        already exists (same content hash) and bulk inserting the rest.
+        Unowned candidates on the chain that no story reaches yet are
+        claimed by ``author``. Safe against concurrent inserts of the same
+        nodes. Should run inside a transaction.
+        """
+        hashes = []
+        parent_hash = ""
+        for text in texts:
+            parent_hash = line_hash(parent_hash, text)
+            hashes.append(parent_hash)
+
+        by_hash = {line.content_hash: line for line in self.filter(content_hash__in=hashes)}
+        missing = [
+            self.model(text=text, content_hash=content_hash, depth=depth, **defaults)
+            for depth, (text, content_hash) in enumerate(zip(texts, hashes))
+            if content_hash not in by_hash
+        ]
+        if missing:
+            # Another request may insert the same nodes meanwhile, so ignore
+            # conflicts and re-select whatever ended up in the table
+            self.bulk_create(missing, ignore_conflicts=True)
+            by_hash.update(
+                (line.content_hash, line)
+                for line in self.filter(content_hash__in=[line.content_hash for line in missing])
+            )
+
+        author = defaults.get("author")
+        unclaimed = author is not None and [
+            line.pk for line in by_hash.values() if not line.is_manual and line.author_id is None
+        ]
+        if unclaimed:
+            # Picked suggestion candidates (see ``create_children``) have no
+            # owner yet; the first story to use one claims it. Once a story
+            # (even an anonymous one) reaches a line, its owner is settled.
+            reached = Story.objects.filter(last_line__path__startswith=OuterRef("path"))
+            self.filter(pk__in=unclaimed, author__isnull=True).exclude(Exists(reached)).update(author=author)
+            authors = dict(self.filter(pk__in=unclaimed).values_list("pk", "author_id"))
+            for line in by_hash.values():
+                if line.pk in authors:
+                    line.author_id = authors[line.pk]
+
+        # Link up the new nodes now that their ids are known
+        lines = [by_hash[content_hash] for content_hash in hashes]
+        to_link = []
+        prev = None
+        for line in lines:
+            if line.path == "":
+                line.link_to(prev)
+                to_link.append(line)
+            prev = line
+        if to_link:
+            self.bulk_update(to_link, ["previous", "path", "depth", "root"])
+        return lines
+
+    def create_children(self, parent, texts, **defaults):
+        """
+        Returns the children of ``parent`` with the given ``texts``, reusing
+        the ones that already exist. Should run inside a transaction.
+        """
+        hashes = {line_hash(parent.content_hash, text): text for text in texts}
+        self.bulk_create(
+            [
+                self.model(text=text, content_hash=content_hash, depth=parent.depth + 1, **defaults)
+                for content_hash, text in hashes.items()
+            ],
+            ignore_conflicts=True,
+        )
+        by_hash = {line.content_hash: line for line in self.filter(content_hash__in=hashes)}
+        to_link = [line for line in by_hash.values() if line.path == ""]
+        for line in to_link:
+            line.link_to(parent)
+        if to_link:
+            self.bulk_update(to_link, ["previous", "path", "depth", "root"])
+        return [by_hash[content_hash] for content_hash in hashes]
+
+
 class Line(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
 
     previous = models.ForeignKey('self', blank=True, null=True, related_name='next', on_delete=models.PROTECT)
+    path = models.TextField(blank=True, default="", db_index=True)
+    # materialized ancestry, e.g. "1/5/9/" for root 1 -> 5 -> 9 (this line)
+    content_hash = models.CharField(max_length=64, unique=True, editable=False)
+    # hash of the parent's hash + normalized text, see ``line_hash``
+    depth = models.PositiveIntegerField(default=0)
+    # 0 for the first line of a story
+    root = models.ForeignKey(
+        'self',
+        blank=True, null=True,
+        on_delete=models.DO_NOTHING,
+        related_name='tree_lines',
+        editable=False,
+    )
+    # the first line of the tree this line belongs to
     text = models.TextField()
     is_last = models.BooleanField(default=False)
 
@@ -28,6 +235,97 @@ class Line(models.Model):
         related_name="liked_lines",
         blank=True,
     )
+    like_count = models.IntegerField(default=0)
+    # denormalized liked_by count, see reconcile_like_counts
+
+    objects = LineQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if not self.content_hash:
+            parent_hash = self.previous.content_hash if self.previous_id else ""
+            self.content_hash = line_hash(parent_hash, self.text)
+        super().save(*args, **kwargs)
+        if not self.path:
+            self.link_to(self.previous)
+            Line.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth, root=self.root_id)
+
+    def link_to(self, parent):
+        """
+        Sets the parent and the ancestry columns derived from it; the line
+        must already have a primary key
+        """
+        self.previous = parent
+        self.path = f"{(parent.path or parent.build_path()) if parent else ''}{self.pk}/"
+        ids = self.ancestor_ids
+        self.depth = len(ids) - 1
+        self.root_id = ids[0]
+
+    def build_path(self):
+        """
+        Computes the materialized path from the parent's path
+        """
+        if self.previous_id is None:
+            return f"{self.pk}/"
+        parent = self.previous
+        return f"{parent.path or parent.build_path()}{self.pk}/"
+
+    @property
+    def ancestor_ids(self):
+        """
+        Returns the ids from the root down to this line
+        """
+        return [int(pk) for pk in self.path.split("/") if pk]
+
+
+def line_snapshot(lines):
+    """
+    Serializes ``lines`` (Lines or line nodes) into the compact
+    ``Story.lines_snapshot`` rows: [uuid, text, is_manual]
+    """
+    return [[str(line.uuid), line.text, line.is_manual] for line in lines]
+
+
+def prefetch_story_lines(stories):
+    """
+    Attaches the ordered lines to every story in ``stories`` (the result of
+    ``Story.get_lines``) with a single query over the ancestry paths.
+    """
+    stories = [story for story in stories if "get_lines" not in story.__dict__]
+    line_ids = {pk for story in stories if story.last_line for pk in story.last_line.ancestor_ids}
+    lines_by_id = Line.objects.in_bulk(line_ids)
+
+    for story in stories:
+        ids = story.last_line.ancestor_ids if story.last_line else []
+        if all(pk in lines_by_id for pk in ids):
+            story.__dict__["get_lines"] = [lines_by_id[pk] for pk in ids]
+        # otherwise leave it to the lazy ``get_lines`` fallback
+    return stories
+
+
+class StoryQuerySet(LikedByQuerySetMixin, models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._with_lines = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_lines = self._with_lines
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if not fetched and self._with_lines and self._iterable_class is models.query.ModelIterable:
+            prefetch_story_lines(self._result_cache)
+
+    def with_lines(self):
+        """
+        Loads the ordered lines of every story alongside the queryset, so
+        ``story.get_lines`` costs no extra queries.
+        """
+        clone = self.select_related("last_line")
+        clone._with_lines = True
+        return clone
 
 
 class Story(models.Model):
@@ -36,6 +334,9 @@ class Story(models.Model):
     last_line = models.ForeignKey(Line, on_delete=models.PROTECT, null=True, blank=True)
     # the final line of the story
 
+    lines_snapshot = models.JSONField(default=list, blank=True, editable=False)
+    # the immutable chain up to last_line, see ``line_snapshot``
+
     title = models.TextField(blank=True, null=True)
     tagline = models.TextField(blank=True, null=True)
 
@@ -44,22 +345,49 @@ class Story(models.Model):
         related_name="liked_stories",
         blank=True,
     )
+    like_count = models.IntegerField(default=0)
+    # denormalized liked_by count, see reconcile_like_counts
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = StoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "stories"
+        indexes = [
+            # keyset pagination of the library
+            models.Index(fields=["-created_at", "-id"], name="story_created_id_idx"),
+        ]
 
     def __str__(self):
-        return self.title
+        return self.title or str(self.uuid)
 
     def author(self):
         return self.last_line.author
 
+    @property
+    def length(self):
+        return self.last_line.depth + 1 if self.last_line else 0
+
     @cached_property
     def get_lines(self):
         """
         Returns the lines of the story
         """
-        return []
+        return Line.objects.path_to(self.last_line)
+
 
+class CachedSuggestion(models.Model):
+    """
+    A model answer stored under the hash of its model, prompt and reasoning
+    parameters, see ``suggestion_cache``
+    """
+    key = models.CharField(max_length=64, unique=True)
+    kind = models.CharField(max_length=20)
+    payload = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
@@ -0,0 +1,63 @@
+"""
+Versioned cache keys for the anonymous story list and detail responses.
+
+Cached responses are never deleted; instead every key embeds a generation
+counter that is bumped whenever the data behind it changes, so stale
+entries simply stop being looked up and expire on their own:
+
+- the list generation covers ``list_stories`` for every set of parameters
+- each story has its own generation covering its ``get_story`` payload
+
+Generations are nanosecond timestamps of the last change, so they also
+serve as ETag versions.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+_LIST_GENERATION_KEY = "stories:gen:list"
+
+
+def _story_generation_key(story_uuid) -> str:
+    return f"stories:gen:story:{story_uuid}"
+
+
+def _generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        # A lost counter restarts from the clock, so old versions never return
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def _bump(key):
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def list_generation() -> int:
+    return _generation(_LIST_GENERATION_KEY)
+
+
+def story_generation(story_uuid) -> int:
+    return _generation(_story_generation_key(story_uuid))
+
+
+def list_key(generation, **params) -> str:
+    raw = repr(sorted(params.items()))
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"stories:list:{generation}:{digest}"
+
+
+def detail_key(story_uuid, generation) -> str:
+    return f"stories:detail:{story_uuid}:{generation}"
+
+
+def bump_list():
+    _bump(_LIST_GENERATION_KEY)
+
+
+def bump_stories(*story_uuids):
+    for story_uuid in story_uuids:
+        _bump(_story_generation_key(story_uuid))
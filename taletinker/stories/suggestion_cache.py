@@ -0,0 +1,183 @@
+"""
+Persistent cache of AI suggestions.
+
+Stories fork from shared prefixes, so many readers ask for suggestions on
+the exact same context. Answers are stored in the database under a hash of
+the model, the prompt messages and the reasoning parameters, with the
+default cache in front (through ``get_or_compute``, so concurrent misses
+call the model once).
+
+Entries expire after ``SUGGESTION_CACHE_TTL`` seconds and the least
+recently used ones are evicted beyond ``SUGGESTION_CACHE_MAX_ENTRIES``
+(every ``SUGGESTION_CACHE_EVICT_EVERY`` stores); the
+``purge_suggestion_cache`` command drops them. Hit/miss counters are
+kept in the default cache, see ``stats``.
+"""
+from datetime import timedelta
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from taletinker.cache import aget_or_compute, get_or_compute
+from taletinker.stories.models import CachedSuggestion
+
+STATS = ("front_hits", "db_hits", "misses")
+
+
+def prompt_key(model, messages, params) -> str:
+    raw = json.dumps([model, messages, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _count(stat) -> int:
+    key = f"suggestions:stats:{stat}"
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted in between, the count restarts
+        cache.add(key, 1, timeout=None)
+        return 1
+
+
+def stats() -> dict:
+    """
+    Returns the counters (across workers) along with the overall hit rate
+    """
+    values = cache.get_many([f"suggestions:stats:{stat}" for stat in STATS])
+    counts = {stat: values.get(f"suggestions:stats:{stat}", 0) for stat in STATS}
+    total = sum(counts.values())
+    counts["hit_rate"] = (counts["front_hits"] + counts["db_hits"]) / total if total else 0.0
+    return counts
+
+
+def _expired_before():
+    return timezone.now() - timedelta(seconds=settings.SUGGESTION_CACHE_TTL)
+
+
+def _stored(key):
+    """
+    Returns the unexpired stored answer for ``key`` (counting the hit), or
+    None
+    """
+    entry = (
+        CachedSuggestion.objects.filter(key=key, created_at__gte=_expired_before())
+        .values_list("pk", "payload")
+        .first()
+    )
+    if entry is None:
+        _count("misses")
+        return None
+    _count("db_hits")
+    CachedSuggestion.objects.filter(pk=entry[0]).update(
+        hits=F("hits") + 1,
+        last_used_at=timezone.now(),
+    )
+    return entry[1]
+
+
+def _store(key, kind, payload):
+    CachedSuggestion.objects.update_or_create(
+        key=key,
+        defaults={
+            "kind": kind,
+            "payload": payload,
+            "hits": 0,
+            "created_at": timezone.now(),
+            "last_used_at": timezone.now(),
+        },
+    )
+    # Evicting costs a count and an index walk, so only every Nth store
+    # pays for it; the table exceeds the limit by at most N entries
+    if _count("stores") % settings.SUGGESTION_CACHE_EVICT_EVERY == 0:
+        evict()
+
+
+def _front_timeout():
+    return min(settings.SUGGESTION_CACHE_TTL, settings.SUGGESTION_CACHE_FRONT_TIMEOUT)
+
+
+def get_or_generate(kind, model, messages, params, generate, *, lock_timeout=10):
+    """
+    Returns the stored answer for this prompt, or ``generate()`` (the model
+    call) stored for the next visitor. Concurrent misses wait for it up to
+    ``lock_timeout`` seconds, which should cover the whole model call.
+    """
+    key = prompt_key(model, messages, params)
+    computed = False
+
+    def lookup():
+        nonlocal computed
+        computed = True
+        payload = _stored(key)
+        if payload is None:
+            payload = generate()
+            _store(key, kind, payload)
+        return payload
+
+    payload = get_or_compute(
+        f"suggestions:{key}", lookup, _front_timeout(), lock_timeout=lock_timeout,
+    )
+    if not computed:
+        _count("front_hits")
+    return payload
+
+
+async def aget_or_generate(kind, model, messages, params, generate, *, lock_timeout=10):
+    """
+    ``get_or_generate`` for async views, where ``generate`` is a coroutine
+    function
+    """
+    key = prompt_key(model, messages, params)
+    computed = False
+
+    async def lookup():
+        nonlocal computed
+        computed = True
+        payload = await sync_to_async(_stored)(key)
+        if payload is None:
+            payload = await generate()
+            await sync_to_async(_store)(key, kind, payload)
+        return payload
+
+    payload = await aget_or_compute(
+        f"suggestions:{key}", lookup, _front_timeout(), lock_timeout=lock_timeout,
+    )
+    if not computed:
+        await sync_to_async(_count)("front_hits")
+    return payload
+
+
+def evict() -> int:
+    """
+    Deletes the least recently used entries beyond the size limit (plus any
+    used at the same time as the last of them)
+    """
+    excess = CachedSuggestion.objects.count() - settings.SUGGESTION_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return 0
+    # Only walks the excess entries of the last_used_at index
+    cutoff = (
+        CachedSuggestion.objects.order_by("last_used_at")
+        .values_list("last_used_at", flat=True)[excess - 1]
+    )
+    deleted, _ = CachedSuggestion.objects.filter(last_used_at__lte=cutoff).delete()
+    return deleted
+
+
+def purge(everything=False) -> int:
+    """
+    Deletes the expired (or all) entries and trims the rest to the size
+    limit. Answers already in the cache front may be served until their
+    front timeout.
+    """
+    entries = CachedSuggestion.objects.all()
+    if not everything:
+        entries = entries.filter(created_at__lt=_expired_before())
+    deleted, _ = entries.delete()
+    return deleted + evict()
@@ -0,0 +1,156 @@
+import threading
+import time
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase, override_settings
+
+from taletinker.cache import aget_or_compute, get_or_compute
+
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM)
+class GetOrComputeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f"value {self.calls}"
+
+    def test_fresh_value_is_not_recomputed(self):
+        self.assertEqual(get_or_compute("k", self.compute, 60), "value 1")
+        self.assertEqual(get_or_compute("k", self.compute, 60), "value 1")
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_value_is_recomputed(self):
+        cache.set("k", ("old", 0.1, time.time() - 1), 60)
+        self.assertEqual(get_or_compute("k", self.compute, 60), "value 1")
+        self.assertIsNone(cache.get("k:lock"))
+
+    def test_stale_value_served_while_locked(self):
+        cache.set("k", ("old", 0.1, time.time() - 1), 60)
+        cache.add("k:lock", 1, 10)
+        self.assertEqual(get_or_compute("k", self.compute, 60), "old")
+        self.assertEqual(self.calls, 0)
+
+    def test_early_recompute_grows_with_beta(self):
+        cache.set("k", ("old", 1.0, time.time() + 30), 60)
+        with patch("taletinker.cache.random.random", return_value=0.5):
+            self.assertEqual(get_or_compute("k", self.compute, 60), "old")
+            self.assertEqual(get_or_compute("k", self.compute, 60, beta=100), "value 1")
+
+    def test_concurrent_misses_compute_once(self):
+        def slow_compute():
+            time.sleep(0.2)
+            return self.compute()
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute("k", slow_compute, 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ["value 1"] * 5)
+
+    def test_waiter_takes_over_when_winner_fails(self):
+        cache.add("k:lock", 1, 10)
+        # The winner's compute() raised and released the lock, storing nothing
+        threading.Timer(0.1, cache.delete, ["k:lock"]).start()
+        started = time.monotonic()
+        self.assertEqual(get_or_compute("k", self.compute, 60), "value 1")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertIsNone(cache.get("k:lock"))
+
+    def test_async_waiter_takes_over_when_winner_fails(self):
+        async def compute():
+            return self.compute()
+
+        cache.add("k:lock", 1, 10)
+        threading.Timer(0.1, cache.delete, ["k:lock"]).start()
+        started = time.monotonic()
+        self.assertEqual(async_to_sync(aget_or_compute)("k", compute, 60), "value 1")
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_lock_of_another_worker_is_kept(self):
+        cache.add("k:lock", "theirs", 10)
+        self.assertEqual(get_or_compute("k", self.compute, 60, lock_timeout=0.1), "value 1")
+        self.assertEqual(cache.get("k:lock"), "theirs")
+
+
+TIERED = {
+    "default": {
+        "BACKEND": "taletinker.cache.TieredCache",
+        "LOCATION": "tiered-tests",
+        "OPTIONS": {"SHARED": "shared", "LOCAL_TIMEOUT": 5, "LOCAL_MAX_BYTES": 1000},
+    },
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "shared-tests"},
+}
+
+
+@override_settings(CACHES=TIERED)
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cache.local.stats.update(dict.fromkeys(cache.local.stats, 0))
+
+    def test_reads_fill_local_tier(self):
+        caches["shared"].set("k", "v")
+        self.assertEqual(cache.get("k"), "v")
+        self.assertEqual(cache.get("k"), "v")
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.stats(), {
+            "local_hits": 1, "local_misses": 2, "shared_hits": 1, "shared_misses": 1,
+        })
+
+    def test_writes_go_to_both_tiers(self):
+        cache.set("k", "v")
+        self.assertEqual(caches["shared"].get("k"), "v")
+        self.assertEqual(cache.get("k"), "v")
+        self.assertEqual(cache.stats()["local_hits"], 1)
+
+        cache.delete("k")
+        self.assertIsNone(cache.get("k"))
+        self.assertIsNone(caches["shared"].get("k"))
+
+    def test_local_copies_expire(self):
+        cache.set("k", "v")
+        caches["shared"].set("k", "changed elsewhere")
+        self.assertEqual(cache.get("k"), "v")
+        with patch("taletinker.cache.time.monotonic", return_value=time.monotonic() + 6):
+            self.assertEqual(cache.get("k"), "changed elsewhere")
+
+    def test_local_tier_evicts_by_size(self):
+        cache.set("a", "x" * 400)
+        cache.set("b", "x" * 400)
+        cache.get("a")
+        cache.set("c", "x" * 400)
+        self.assertLessEqual(cache.local.size, 1000)
+        self.assertEqual(cache.get("a"), "x" * 400)
+        self.assertEqual(cache.stats()["shared_hits"], 0)
+        cache.get("b")
+        self.assertEqual(cache.stats()["shared_hits"], 1)
+
+    def test_get_or_compute_sees_locks_released_elsewhere(self):
+        # Another worker holds the lock, and this process has read it
+        caches["shared"].add("k:lock", 1, 10)
+        cache.get("k:lock")
+        # That worker fails and releases it on the shared tier only
+        threading.Timer(0.1, caches["shared"].delete, ["k:lock"]).start()
+        started = time.monotonic()
+        self.assertEqual(get_or_compute("k", lambda: "value", 60), "value")
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_add_is_atomic_on_shared_tier(self):
+        self.assertTrue(cache.add("lock", 1))
+        self.assertFalse(cache.add("lock", 1))
+        self.assertEqual(caches["shared"].get("lock"), 1)
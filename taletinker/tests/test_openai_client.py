@@ -0,0 +1,49 @@
+import os
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from taletinker import openai_client
+
+
+@patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
+@override_settings(
+    AI_TIMEOUT=30,
+    AI_MAX_RETRIES=2,
+    AI_ENDPOINT_OPTIONS={"check_line": {"timeout": 5, "max_retries": 0}},
+)
+class OpenAIClientTests(SimpleTestCase):
+    def setUp(self):
+        openai_client.reset()
+        self.addCleanup(openai_client.reset)
+
+    def test_client_is_shared(self):
+        self.assertIs(openai_client.get_client(), openai_client.get_client())
+
+    def test_endpoints_share_the_connection_pool(self):
+        check_line = openai_client.for_endpoint("check_line")
+        suggest = openai_client.for_endpoint("suggest")
+
+        self.assertIs(check_line._client, openai_client.get_client()._client)
+        self.assertIs(suggest._client, check_line._client)
+        self.assertEqual((check_line.timeout.read, check_line.max_retries), (5, 0))
+        self.assertEqual((suggest.timeout.read, suggest.max_retries), (30, 2))
+
+    def test_call_budget_covers_retries(self):
+        self.assertEqual(openai_client.call_budget("check_line"), 5)
+        self.assertEqual(openai_client.call_budget("suggest"), 90)
+
+    def test_forked_children_build_their_own_client(self):
+        parent_client = openai_client.get_client()
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Child: report whether a fresh client was built, then exit
+            fresh = openai_client._client is None and openai_client.get_client() is not parent_client
+            os.write(write, b"1" if fresh else b"0")
+            os._exit(0)
+        os.close(write)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), b"1")
+        os.close(read)
+        self.assertIs(openai_client.get_client(), parent_client)
@@ -1,14 +1,28 @@
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
-from taletinker.stories.models import Story, Line
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from taletinker import api_stories
+from taletinker.api_stories import LineCheckSchema, LineSuggestSchema, SuggestSchema
+from taletinker.stories import like_buffer, line_cache
+from taletinker.stories.models import CachedSuggestion, Story, Line, LineQuerySet
 import json
+import threading
+import time
+from io import StringIO
 from types import SimpleNamespace
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 User = get_user_model()
 
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
 class StoryApiTests(TestCase):
     def setUp(self):
+        cache.clear()
+        line_cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(username="test", email="test@example.com", password="pw")
         self.client.force_login(self.user)
@@ -102,6 +116,173 @@ class StoryApiTests(TestCase):
         # A should have two next lines: B and X
         self.assertEqual(line_a.next.count(), 2)
 
+    def test_line_paths_index_ancestry(self):
+        self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B"]}), content_type="application/json")
+        self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "X"]}), content_type="application/json")
+
+        a = Line.objects.get(text="A")
+        b = Line.objects.get(text="B")
+        x = Line.objects.get(text="X")
+        self.assertEqual(a.path, f"{a.id}/")
+        self.assertEqual(b.path, f"{a.id}/{b.id}/")
+        self.assertEqual(x.ancestor_ids, [a.id, x.id])
+        self.assertEqual([a.depth, b.depth, x.depth], [0, 1, 1])
+        self.assertEqual({a.root_id, b.root_id, x.root_id}, {a.id})
+        self.assertEqual(list(Line.objects.filter(path__startswith=a.path).order_by("id")), [a, b, x])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Line.objects.path_to(b), [a, b])
+
+    def test_line_cache_get_ancestors(self):
+        a_b = Line.objects.create_chain(["A", "B"])
+        a_x_y = Line.objects.create_chain(["A", "X", "Y"])
+
+        # Nodes read in a transaction that rolls back are not cached
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                line_cache.get_ancestors(a_b.id)
+                raise IntegrityError
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(2):
+            line_cache.get_ancestors(a_b.id)
+
+        # the lines, then their ancestors from the paths; cached on commit
+        line_cache.clear()
+        with self.assertNumQueries(2), self.captureOnCommitCallbacks(execute=True):
+            chains = line_cache.get_ancestors_many([a_b.id, a_x_y.id])
+        self.assertEqual([node.text for node in chains[a_x_y.id]], ["A", "X", "Y"])
+        self.assertEqual(chains[a_b.id][-1], (a_b.id, a_b.uuid, a_b.previous_id, "B", False))
+        with self.assertNumQueries(0):
+            self.assertEqual([node.text for node in line_cache.get_ancestors(a_b.id)], ["A", "B"])
+
+        # Known paths save the first round trip
+        line_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(line_cache.get_ancestors(a_x_y.id, a_x_y.path)), 3)
+
+        # Chains without a backfilled path are fetched parent by parent
+        line_cache.clear()
+        Line.objects.update(path="")
+        with self.assertNumQueries(3):
+            self.assertEqual([node.text for node in line_cache.get_ancestors(a_x_y.id)], ["A", "X", "Y"])
+
+    def test_story_snapshot_and_backfill(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B"]}), content_type="application/json")
+        story = Story.objects.get(uuid=resp.json()["id"])
+        a, b = Line.objects.path_to(story.last_line)
+        self.assertEqual(story.lines_snapshot, [[str(a.uuid), "A", True], [str(b.uuid), "B", True]])
+
+        Story.objects.update(lines_snapshot=[])
+        self.assertEqual(self.client.get(f"{self.stories_url}{story.uuid}").json()["lines"][1]["text"], "B")
+        call_command("backfill_story_snapshots", stdout=StringIO())
+        story.refresh_from_db()
+        self.assertEqual(story.lines_snapshot, [[str(a.uuid), "A", True], [str(b.uuid), "B", True]])
+
+    def test_backfill_line_paths(self):
+        self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B", "C"]}), content_type="application/json")
+        fields = ("id", "path", "depth", "root_id")
+        expected = list(Line.objects.order_by("id").values_list(*fields))
+        Line.objects.update(path="", depth=0, root=None)
+
+        call_command("backfill_line_paths", stdout=StringIO())
+
+        self.assertEqual(list(Line.objects.order_by("id").values_list(*fields)), expected)
+
+    def test_with_lines_prefetches_in_constant_queries(self):
+        for lines in (["A", "B"], ["A", "X", "Y"], ["Z"]):
+            self.client.post(self.stories_url, data=json.dumps({"lines": lines}), content_type="application/json")
+
+        with self.assertNumQueries(2):
+            stories = list(Story.objects.with_lines().order_by("created_at"))
+            texts = [[line.text for line in story.get_lines] for story in stories]
+
+        self.assertEqual(texts, [["A", "B"], ["A", "X", "Y"], ["Z"]])
+
+    def test_story_admin_loads_lines_in_bulk(self):
+        admin_user = User.objects.create_superuser(username="admin", email="admin@example.com", password="pw")
+        admin_client = Client()
+        admin_client.force_login(admin_user)
+        url = "/admin-qweasd123/stories/story/"
+
+        def changelist_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(admin_client.get(url).status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.client.post(self.stories_url, data=json.dumps({"lines": ["Opening line", "B"]}), content_type="application/json")
+        queries = changelist_queries()
+        for lines in (["A", "X", "Y"], ["Z"]):
+            self.client.post(self.stories_url, data=json.dumps({"lines": lines}), content_type="application/json")
+        self.assertEqual(changelist_queries(), queries)
+        self.assertContains(admin_client.get(url), "Opening line")
+
+    def test_create_story_query_count_independent_of_length(self):
+        def post_lines(lines):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post(self.stories_url, data=json.dumps({"lines": lines}), content_type="application/json")
+            self.assertEqual(resp.status_code, 200)
+            return len(ctx.captured_queries)
+
+        base = [f"Line {i}" for i in range(30)]
+        post_lines(base[:3])
+        short_fork = post_lines(base[:3] + ["Short fork"])
+        long_fork = post_lines(base[:3] + [f"Fork {i}" for i in range(27)])
+
+        self.assertEqual(short_fork, long_fork)
+        # The shared prefix was reused, not duplicated
+        self.assertEqual(Line.objects.filter(text="Line 2").count(), 1)
+        last = Story.objects.order_by("-id").first().last_line
+        self.assertEqual([line.text for line in Line.objects.path_to(last)][:4], base[:3] + ["Fork 0"])
+
+    def test_line_content_hash_dedups_siblings(self):
+        first = Line.objects.create_chain(["A", "B"], is_manual=True)
+        again = Line.objects.create_chain(["A", "  B "], is_manual=True)
+        self.assertEqual(first, again)
+        self.assertEqual(Line.objects.count(), 2)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Line.objects.create(text="B", previous=first.previous, content_hash=first.content_hash)
+
+    def test_create_chain_reuses_nodes_inserted_concurrently(self):
+        # Another request inserts the same root between our lookup and insert
+        original_bulk_create = LineQuerySet.bulk_create
+        concurrent = []
+
+        def racing_bulk_create(qs, objs, **kwargs):
+            concurrent.append(Line.objects.create(text="A"))
+            return original_bulk_create(qs, objs, **kwargs)
+
+        with patch.object(LineQuerySet, "bulk_create", racing_bulk_create):
+            last = Line.objects.create_chain(["A", "B"], is_manual=True)
+
+        self.assertEqual(last.previous_id, concurrent[0].id)
+        self.assertEqual(Line.objects.filter(text="A").count(), 1)
+        self.assertEqual(last.path, f"{concurrent[0].id}/{last.id}/")
+
+    def test_story_tree(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"title": "AB", "lines": ["A", "B"]}), content_type="application/json")
+        ab_id = resp.json()["id"]
+        root = Line.objects.get(text="A")
+
+        url = f"{self.stories_url}tree/{root.uuid}"
+        tree = self.client.get(url).json()
+        self.assertEqual(tree["root_id"], str(root.uuid))
+        self.assertEqual([(n["text"], n["parent"]) for n in tree["nodes"]], [("A", None), ("B", 0)])
+        self.assertEqual(tree["nodes"][1]["stories"], [{"id": ab_id, "title": "AB"}])
+
+        # Served from cache until a new branch is added
+        with self.assertNumQueries(1):  # the line lookup
+            self.client.get(url)
+
+        self.client.post(self.stories_url, data=json.dumps({"title": "AX", "lines": ["A", "X"]}), content_type="application/json")
+        tree = self.client.get(url).json()
+        self.assertEqual(sorted((n["text"], n["parent"]) for n in tree["nodes"]), [("A", None), ("B", 0), ("X", 0)])
+
+        # Any line of the tree resolves to the same tree
+        b = Line.objects.get(text="B")
+        self.assertEqual(self.client.get(f"{self.stories_url}tree/{b.uuid}").json(), tree)
+        self.assertEqual(self.client.get(f"{self.stories_url}tree/not-a-uuid").status_code, 404)
+
     def test_list_stories(self):
         self.client.post(self.stories_url, data=json.dumps({"title": "S1", "lines": ["1"]}), content_type="application/json")
         self.client.post(self.stories_url, data=json.dumps({"title": "S2", "lines": ["2"]}), content_type="application/json")
@@ -112,10 +293,76 @@ class StoryApiTests(TestCase):
         self.assertEqual(len(data), 2)
         # Ordered by created_at desc
         self.assertEqual(data[0]["title"], "S2")
+        self.assertEqual(data[0]["length"], 1)
+        self.assertEqual(data[0]["root_node_id"], data[0]["lines"][0]["id"])
         # Ensure likes fields are present
         self.assertIn("like_count", data[0])
         self.assertIn("is_liked", data[0])
 
+    def test_list_stories_query_count_independent_of_size(self):
+        def list_query_count():
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(self.stories_url).json()
+            return len(ctx.captured_queries), data
+
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B"]}), content_type="application/json")
+        self.client.post(f"{self.stories_url}{resp.json()['id']}/like")
+        small, _ = list_query_count()
+
+        for i in range(10):
+            self.client.post(self.stories_url, data=json.dumps({"lines": ["A", f"C{i}"]}), content_type="application/json")
+        large, data = list_query_count()
+
+        self.assertEqual(small, large)
+        self.assertEqual([(s["like_count"], s["is_liked"]) for s in data][-1], (1, True))
+        self.assertEqual(sum(s["like_count"] for s in data), 1)
+
+    def test_fast_responses_match_validated_ones(self):
+        for i in range(3):
+            self.client.post(self.stories_url, data=json.dumps({"title": f"S{i}", "lines": ["A", f"{i}"]}), content_type="application/json")
+        story_uuid = Story.objects.latest("id").uuid
+        urls = [f"{self.stories_url}?limit=2", f"{self.stories_url}?view=summary", f"{self.stories_url}{story_uuid}"]
+
+        validated = [self.client.get(url) for url in urls]
+        with override_settings(STORY_FAST_RESPONSES=True):
+            fast = [self.client.get(url) for url in urls]
+
+        for slow, quick in zip(validated, fast):
+            self.assertEqual(quick.json(), slow.json())
+            self.assertEqual(quick["ETag"], slow["ETag"])
+        self.assertEqual(fast[0]["X-Next-Cursor"], validated[0]["X-Next-Cursor"])
+        # The documented schemas are unchanged
+        schemas = self.client.get("/api/openapi.json").json()["components"]["schemas"]
+        self.assertIn("StoryListSchema", schemas)
+
+    def test_list_stories_cursor_pagination(self):
+        for i in range(5):
+            self.client.post(self.stories_url, data=json.dumps({"title": f"S{i}", "lines": [f"{i}"]}), content_type="application/json")
+
+        titles = []
+        cursor = None
+        while True:
+            url = f"{self.stories_url}?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            response = self.client.get(url)
+            titles.extend(story["title"] for story in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        self.assertEqual(titles, ["S4", "S3", "S2", "S1", "S0"])
+        self.assertEqual(self.client.get(f"{self.stories_url}?cursor=bogus").status_code, 400)
+
+    def test_list_stories_sparse_fields(self):
+        self.client.post(self.stories_url, data=json.dumps({"title": "S1", "lines": ["1"]}), content_type="application/json")
+
+        summary = self.client.get(f"{self.stories_url}?view=summary").json()[0]
+        self.assertNotIn("lines", summary)
+        self.assertEqual(summary["title"], "S1")
+
+        sparse = self.client.get(f"{self.stories_url}?fields=title,length").json()[0]
+        self.assertEqual(set(sparse), {"id", "uuid", "title", "length"})
+        self.assertEqual(self.client.get(f"{self.stories_url}?fields=nope").status_code, 400)
+
     def test_like_story(self):
         # Create story
         resp = self.client.post(
@@ -138,6 +385,195 @@ class StoryApiTests(TestCase):
         self.assertEqual(resp.json()["like_count"], 0)
         self.assertEqual(resp.json()["is_liked"], False)
 
+    def test_reconcile_like_counts(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["Like me"]}), content_type="application/json")
+        story = Story.objects.get(uuid=resp.json()["id"])
+        self.client.post(f"{self.stories_url}{story.uuid}/like")
+        self.client.post(f"{self.stories_url}lines/{story.last_line.uuid}/like")
+        self.assertEqual(Story.objects.get(pk=story.pk).like_count, 1)
+
+        Story.objects.update(like_count=7)
+        Line.objects.update(like_count=-2)
+        call_command("reconcile_like_counts", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(Story.objects.get(pk=story.pk).like_count, 1)
+        self.assertEqual(Line.objects.get(pk=story.last_line_id).like_count, 1)
+
+    def test_put_delete_like_are_idempotent(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["Like me"]}), content_type="application/json")
+        story = Story.objects.get(uuid=resp.json()["id"])
+
+        for url in (f"{self.stories_url}{story.uuid}/like", f"{self.stories_url}lines/{story.last_line.uuid}/like"):
+            for _ in range(2):
+                resp = self.client.put(url)
+                self.assertEqual(resp.json(), {"success": True, "like_count": 1, "is_liked": True})
+            for _ in range(2):
+                resp = self.client.delete(url)
+                self.assertEqual(resp.json(), {"success": True, "like_count": 0, "is_liked": False})
+
+    @override_settings(LIKE_BUFFER_ENABLED=True, LIKE_BUFFER_CACHE="default")
+    def test_buffered_likes_coalesce_and_flush(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["Like me"]}), content_type="application/json")
+        story = Story.objects.get(uuid=resp.json()["id"])
+        story_url = f"{self.stories_url}{story.uuid}"
+        line_url = f"{self.stories_url}lines/{story.last_line.uuid}/like"
+
+        # like, unlike, like again: only the last intent survives
+        for expected in (True, False, True):
+            resp = self.client.post(f"{story_url}/like")
+            self.assertEqual(resp.json()["is_liked"], expected)
+        self.client.put(line_url)
+
+        # Nothing written yet, but the viewer already sees their likes
+        self.assertEqual(story.liked_by.count(), 0)
+        data = self.client.get(story_url).json()
+        self.assertEqual((data["like_count"], data["is_liked"]), (1, True))
+        self.assertEqual((data["lines"][0]["like_count"], data["lines"][0]["is_liked"]), (1, True))
+        listed = self.client.get(self.stories_url).json()[0]
+        self.assertEqual((listed["like_count"], listed["is_liked"]), (1, True))
+
+        call_command("flush_like_buffer", stdout=StringIO())
+
+        story.refresh_from_db()
+        self.assertEqual((story.like_count, story.liked_by.count()), (1, 1))
+        self.assertEqual(Line.objects.get(pk=story.last_line_id).like_count, 1)
+
+        self.client.delete(line_url)
+        call_command("flush_like_buffer", stdout=StringIO())
+        self.assertEqual(Line.objects.get(pk=story.last_line_id).like_count, 0)
+        data = self.client.get(story_url).json()
+        self.assertEqual((data["lines"][0]["like_count"], data["lines"][0]["is_liked"]), (0, False))
+
+    @override_settings(LIKE_BUFFER_ENABLED=True, LIKE_BUFFER_CACHE="default")
+    def test_like_buffer_locks_per_user(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["Busy"]}), content_type="application/json")
+        story_url = f"{self.stories_url}{resp.json()['id']}/like"
+        other = User.objects.create_user(username="other", email="other@example.com", password="pw")
+
+        self.assertEqual(self.client.put(story_url).status_code, 200)
+        # Neither another user's write nor a flush taking the list of
+        # pending users holds up an already registered user
+        cache.add(f"likes:lock:{other.id}", 1, 10)
+        cache.add("likes:lock:users", 1, 10)
+        started = time.monotonic()
+        self.assertEqual(self.client.delete(story_url).status_code, 200)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(list(like_buffer.pending_for_user(self.user).values()), [False])
+
+    @override_settings(
+        LIKE_BUFFER_ENABLED=True,
+        LIKE_BUFFER_CACHE="files",
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "files": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/likes"},
+        },
+    )
+    def test_like_buffer_warns_on_file_cache(self):
+        self.assertEqual([error.id for error in like_buffer.check_cache(None)], ["stories.W001"])
+
+    @override_settings(LIKE_BUFFER_ENABLED=True, LIKE_BUFFER_CACHE="default")
+    def test_buffered_like_on_deleted_story_is_dropped(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["Gone"]}), content_type="application/json")
+        story = Story.objects.get(uuid=resp.json()["id"])
+        self.client.put(f"{self.stories_url}{story.uuid}/like")
+        self.client.put(f"{self.stories_url}lines/{story.last_line.uuid}/like")
+        story.delete()
+
+        call_command("flush_like_buffer", stdout=StringIO())
+        self.assertEqual(like_buffer.pending_for_user(self.user), {})
+        self.assertEqual(Line.objects.get(pk=story.last_line_id).like_count, 1)
+
+    def test_my_likes(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["Like me"]}), content_type="application/json")
+        story = Story.objects.get(uuid=resp.json()["id"])
+        self.client.put(f"{self.stories_url}{story.uuid}/like")
+        url = f"{self.stories_url}likes/mine"
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.json()["stories"], [str(story.uuid)])
+        self.assertEqual(resp.json()["lines"], [])
+        etag = resp.headers["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        cursor = resp.json()["cursor"]
+        self.client.put(f"{self.stories_url}lines/{story.last_line.uuid}/like")
+        resp = self.client.get(f"{url}?since={cursor}")
+        self.assertEqual(resp.json()["stories"], [])
+        self.assertEqual(resp.json()["lines"], [str(story.last_line.uuid)])
+        self.assertNotEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_shared_payload_for_logged_in_viewers(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["Like me"]}), content_type="application/json")
+        detail_url = f"{self.stories_url}{resp.json()['id']}"
+        self.client.put(f"{detail_url}/like")
+        anon = Client()
+
+        for url in (self.stories_url, detail_url):
+            first = anon.get(url)
+            own = self.client.get(url).json()
+            self.assertTrue((own[0] if isinstance(own, list) else own)["is_liked"])
+
+            # The same payload (and ETag) as anonymous viewers get, from the
+            # shared cache; likes come from /likes/mine instead
+            with patch.object(api_stories, "build_story_payload", side_effect=AssertionError), \
+                    patch.object(Story.objects, "select_related", side_effect=AssertionError):
+                shared = self.client.get(f"{url}?shared=true")
+            self.assertEqual(shared.json(), first.json())
+            self.assertEqual(shared.headers["ETag"], first.headers["ETag"])
+        self.assertFalse(shared.json()["is_liked"])
+
+    def test_anonymous_responses_are_cached_until_changed(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"title": "Old", "lines": ["A", "B"]}), content_type="application/json")
+        story = Story.objects.get(uuid=resp.json()["id"])
+        detail_url = f"{self.stories_url}{story.uuid}"
+        anon = Client()
+
+        self.assertEqual(anon.get(self.stories_url).json()[0]["title"], "Old")
+        self.assertEqual(anon.get(detail_url).json()["title"], "Old")
+        with self.assertNumQueries(0):
+            anon.get(self.stories_url)
+            anon.get(detail_url)
+
+        self.client.patch(detail_url, data=json.dumps({"title": "New"}), content_type="application/json")
+        self.assertEqual(anon.get(self.stories_url).json()[0]["title"], "New")
+        self.assertEqual(anon.get(detail_url).json()["title"], "New")
+
+        self.client.put(f"{detail_url}/like")
+        self.assertEqual(anon.get(self.stories_url).json()[0]["like_count"], 1)
+        self.assertEqual(anon.get(detail_url).json()["like_count"], 1)
+
+        self.client.put(f"{self.stories_url}lines/{story.last_line.previous.uuid}/like")
+        self.assertEqual(anon.get(detail_url).json()["lines"][0]["like_count"], 1)
+
+        self.client.post(self.stories_url, data=json.dumps({"title": "Second", "lines": ["C"]}), content_type="application/json")
+        self.assertEqual(len(anon.get(self.stories_url).json()), 2)
+
+    def test_conditional_get(self):
+        resp = self.client.post(self.stories_url, data=json.dumps({"title": "Tag", "lines": ["A"]}), content_type="application/json")
+        detail_url = f"{self.stories_url}{resp.json()['id']}"
+        anon = Client()
+
+        for url in (self.stories_url, detail_url):
+            first = anon.get(url)
+            etag = first.headers["ETag"]
+            # Second resolution dates would hide changes made within a second
+            self.assertNotIn("Last-Modified", first.headers)
+            future = "Fri, 01 Jan 2100 00:00:00 GMT"
+            self.assertEqual(anon.get(url, HTTP_IF_MODIFIED_SINCE=future).status_code, 200)
+            with self.assertNumQueries(0):
+                revalidated = anon.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.headers["ETag"], etag)
+            # The viewer's liked flags are part of the payload
+            self.assertNotEqual(self.client.get(url).headers["ETag"], etag)
+
+        etag = anon.get(detail_url).headers["ETag"]
+        self.client.put(f"{detail_url}/like")
+        self.assertEqual(anon.get(detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
     def test_like_line(self):
         # Create story
         resp = self.client.post(
@@ -163,10 +599,28 @@ class StoryApiTests(TestCase):
         self.assertEqual(resp_get.json()["lines"][0]["like_count"], 1)
         self.assertEqual(resp_get.json()["lines"][0]["is_liked"], True)
 
+    def test_get_story_query_count_for_long_story(self):
+        lines = [f"Line {i}" for i in range(200)]
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": lines}), content_type="application/json")
+        story_id = resp.json()["id"]
+        liked = Line.objects.get(text="Line 42")
+        self.client.post(f"{self.stories_url}lines/{liked.uuid}/like")
+
+        # session, user, story with likes and snapshot, line likes
+        line_cache.clear()
+        with self.assertNumQueries(4):
+            data = self.client.get(f"{self.stories_url}{story_id}").json()
+
+        self.assertEqual(len(data["lines"]), 200)
+        self.assertEqual([line["like_count"] for line in data["lines"]].count(1), 1)
+        self.assertEqual(data["lines"][42]["like_count"], 1)
+        self.assertTrue(data["lines"][42]["is_liked"])
+        self.assertFalse(data["lines"][41]["is_liked"])
+
     @patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
-    @patch("taletinker.api_stories.openai.OpenAI")
-    def test_suggest_returns_two_options_with_single_openai_call(self, mock_openai):
-        mock_client = mock_openai.return_value
+    @patch("taletinker.openai_client.for_endpoint")
+    def test_suggest_returns_two_options_with_single_openai_call(self, mock_for_endpoint):
+        mock_client = mock_for_endpoint.return_value
         mock_client.responses.parse.return_value = SimpleNamespace(
             output_parsed=SimpleNamespace(options=["Option 1", "Option 2"])
         )
@@ -180,3 +634,238 @@ class StoryApiTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), ["Option 1", "Option 2"])
         mock_client.responses.parse.assert_called_once()
+
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
+    @patch("taletinker.openai_client.for_endpoint")
+    def test_suggestions_are_cached_by_prompt(self, mock_for_endpoint):
+        mock_client = mock_for_endpoint.return_value
+        mock_client.responses.parse.return_value = SimpleNamespace(
+            output_parsed=SimpleNamespace(options=["Option 1", "Option 2"])
+        )
+
+        def suggest(context):
+            return self.client.post(
+                f"{self.stories_url}suggest",
+                data=json.dumps({"context": context}),
+                content_type="application/json"
+            ).json()
+
+        self.assertEqual(suggest(["Shared start"]), ["Option 1", "Option 2"])
+        self.assertEqual(suggest(["Shared start"]), ["Option 1", "Option 2"])
+        # Another worker only has the database copy
+        cache.clear()
+        self.assertEqual(suggest(["Shared start"]), ["Option 1", "Option 2"])
+        self.assertEqual(mock_client.responses.parse.call_count, 1)
+        entry = CachedSuggestion.objects.get(payload=["Option 1", "Option 2"], hits=1)
+        self.assertEqual(entry.kind, "lines")
+
+        with override_settings(SUGGESTION_CACHE_MAX_ENTRIES=1, SUGGESTION_CACHE_EVICT_EVERY=3):
+            # Stores since the cache was cleared: 1
+            suggest(["Another start"])
+            self.assertEqual(mock_client.responses.parse.call_count, 2)
+            self.assertEqual(CachedSuggestion.objects.count(), 2)
+            call_command("purge_suggestion_cache", stdout=StringIO())
+            self.assertEqual(CachedSuggestion.objects.get().hits, 0)
+
+            # Every third store evicts
+            suggest(["Third start"])
+            self.assertEqual(CachedSuggestion.objects.count(), 2)
+            suggest(["Fourth start"])
+            self.assertEqual(CachedSuggestion.objects.count(), 1)
+        call_command("purge_suggestion_cache", "--all", stdout=StringIO())
+        self.assertFalse(CachedSuggestion.objects.exists())
+
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
+    @patch("taletinker.openai_client.for_endpoint")
+    def test_node_suggestions_are_stored_as_candidates(self, mock_for_endpoint):
+        mock_client = mock_for_endpoint.return_value
+        mock_client.responses.parse.return_value = SimpleNamespace(
+            output_parsed=SimpleNamespace(options=["Option 1", "Option 2"])
+        )
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B"]}), content_type="application/json")
+        node = Story.objects.get(uuid=resp.json()["id"]).last_line
+
+        def suggest():
+            return self.client.post(
+                f"{self.stories_url}suggest",
+                data=json.dumps({"line_uuid": str(node.uuid)}),
+                content_type="application/json"
+            ).json()
+
+        self.assertEqual(suggest(), ["Option 1", "Option 2"])
+        prompt = mock_client.responses.parse.call_args.kwargs["input"][1]["content"]
+        self.assertTrue(prompt.endswith("A\\nB"))
+        self.assertEqual(
+            sorted(node.next.values_list("text", "is_manual", "depth")),
+            [("Option 1", False, 2), ("Option 2", False, 2)],
+        )
+
+        # Served from the node, even without the prompt cache
+        call_command("purge_suggestion_cache", "--all", stdout=StringIO())
+        cache.clear()
+        self.assertEqual(suggest(), ["Option 1", "Option 2"])
+        mock_client.responses.parse.assert_called_once()
+
+        # Unused candidates stay out of the tree
+        tree = self.client.get(f"{self.stories_url}tree/{node.uuid}").json()
+        self.assertEqual([n["text"] for n in tree["nodes"]], ["A", "B"])
+
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
+    @patch("taletinker.openai_client.for_endpoint")
+    def test_story_ending_on_candidate_is_owned(self, mock_for_endpoint):
+        mock_for_endpoint.return_value.responses.parse.return_value = SimpleNamespace(
+            output_parsed=SimpleNamespace(options=["Option 1", "Option 2"])
+        )
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B"]}), content_type="application/json")
+        node = Story.objects.get(uuid=resp.json()["id"]).last_line
+        self.client.post(
+            f"{self.stories_url}suggest",
+            data=json.dumps({"line_uuid": str(node.uuid)}),
+            content_type="application/json"
+        )
+
+        resp = self.client.post(
+            self.stories_url,
+            data=json.dumps({"lines": ["A", "B", "Option 1"]}),
+            content_type="application/json"
+        )
+        story_uuid = resp.json()["id"]
+        line = Line.objects.get(text="Option 1")
+        self.assertEqual(line.author, self.user)
+        self.assertFalse(line.is_manual)
+        self.assertEqual(self.client.get(f"{self.stories_url}{story_uuid}").json()["author_name"], "te**@exa**le.com")
+
+        # Claimed candidates are not handed over to later stories
+        other = User.objects.create_user(username="other", email="other@example.com", password="pw")
+        Line.objects.create_chain(["A", "B", "Option 1"], author=other, is_manual=True)
+        self.assertEqual(Line.objects.get(text="Option 1").author, self.user)
+
+        resp = self.client.delete(f"{self.stories_url}{story_uuid}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(Story.objects.filter(uuid=story_uuid).exists())
+
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
+    @patch("taletinker.openai_client.for_endpoint")
+    def test_candidate_used_anonymously_is_not_claimed(self, mock_for_endpoint):
+        mock_for_endpoint.return_value.responses.parse.return_value = SimpleNamespace(
+            output_parsed=SimpleNamespace(options=["Option 1", "Option 2"])
+        )
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B"]}), content_type="application/json")
+        node = Story.objects.get(uuid=resp.json()["id"]).last_line
+        self.client.post(
+            f"{self.stories_url}suggest",
+            data=json.dumps({"line_uuid": str(node.uuid)}),
+            content_type="application/json"
+        )
+
+        anon_uuid = Client().post(
+            self.stories_url,
+            data=json.dumps({"lines": ["A", "B", "Option 1"]}),
+            content_type="application/json"
+        ).json()["id"]
+        self.client.post(
+            self.stories_url,
+            data=json.dumps({"lines": ["A", "B", "Option 1"]}),
+            content_type="application/json"
+        )
+
+        self.assertIsNone(Line.objects.get(text="Option 1").author)
+        self.assertEqual(self.client.delete(f"{self.stories_url}{anon_uuid}").status_code, 403)
+        self.assertTrue(Story.objects.filter(uuid=anon_uuid).exists())
+
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
+    @patch("taletinker.openai_client.for_endpoint")
+    def test_reuse_strategy_ranks_human_continuations(self, mock_for_endpoint):
+        mock_client = mock_for_endpoint.return_value
+        mock_client.responses.parse.return_value = SimpleNamespace(
+            output_parsed=SimpleNamespace(options=["Option 1", "Option 2"])
+        )
+        for lines in (["A", "Quiet"], ["A", "Popular", "More"], ["A", "Liked"], ["B", "Lonely"]):
+            self.client.post(self.stories_url, data=json.dumps({"lines": lines}), content_type="application/json")
+        self.client.post(f"{self.stories_url}lines/{Line.objects.get(text='Liked').uuid}/like")
+
+        def suggest(text, strategy):
+            return self.client.post(
+                f"{self.stories_url}suggest",
+                data=json.dumps({"line_uuid": str(Line.objects.get(text=text).uuid), "strategy": strategy}),
+                content_type="application/json"
+            )
+
+        self.assertEqual(suggest("A", "reuse").json(), ["Liked", "Popular"])
+        mock_client.responses.parse.assert_not_called()
+
+        # Only the missing option comes from the model
+        self.assertEqual(suggest("B", "reuse").json(), ["Lonely", "Option 1"])
+        self.assertEqual(suggest("B", "model").json(), ["Option 1", "Option 2"])
+        mock_client.responses.parse.assert_called_once()
+        self.assertEqual(suggest("B", "bogus").status_code, 400)
+
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
+    @patch("taletinker.openai_client.for_endpoint_async")
+    def test_async_ai_views(self, mock_for_endpoint_async):
+        mock_client = mock_for_endpoint_async.return_value
+        mock_client.responses.parse = AsyncMock(side_effect=[
+            SimpleNamespace(output_parsed=SimpleNamespace(options=["Option 1", "Option 2"])),
+            SimpleNamespace(output_parsed=SimpleNamespace(is_valid=True, line="The cat sat down.", reason="")),
+            SimpleNamespace(output_parsed=SimpleNamespace(title=" Cat Tale ", tagline="A sitting cat")),
+        ])
+        resp = self.client.post(self.stories_url, data=json.dumps({"lines": ["A", "B"]}), content_type="application/json")
+        node = Story.objects.get(uuid=resp.json()["id"]).last_line
+        request = RequestFactory().post("/")
+
+        options = async_to_sync(api_stories.asuggest_lines)(request, LineSuggestSchema(line_uuid=str(node.uuid)))
+        self.assertEqual(options, ["Option 1", "Option 2"])
+        self.assertEqual(node.next.filter(is_manual=False).count(), 2)
+        # Stored candidates need no model call
+        async_to_sync(api_stories.asuggest_lines)(request, LineSuggestSchema(line_uuid=str(node.uuid)))
+
+        check = async_to_sync(api_stories.acheck_line)(request, LineCheckSchema(line="Teh cat sat down.", context=["A"]))
+        self.assertEqual(check, {"is_valid": True, "line": "The cat sat down.", "reason": None})
+        meta = async_to_sync(api_stories.asuggest_story_meta)(request, SuggestSchema(context=["A", "B"]))
+        self.assertEqual(meta, {"title": "Cat Tale", "tagline": "A sitting cat"})
+        self.assertEqual(mock_client.responses.parse.await_count, 3)
+
+    def test_suggest_unknown_line(self):
+        resp = self.client.post(
+            f"{self.stories_url}suggest",
+            data=json.dumps({"line_uuid": "not-a-uuid"}),
+            content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 404)
+
+
+class ConcurrentLikeTests(TransactionTestCase):
+    def test_concurrent_puts_count_once(self):
+        user = User.objects.create_user(username="racer", email="racer@example.com", password="pw")
+        line = Line.objects.create_chain(["Race me"], is_manual=True)
+        story = Story.objects.create(title="Race", last_line=line)
+        barrier = threading.Barrier(8)
+        errors = []
+
+        def like():
+            barrier.wait()
+            try:
+                # The shared in-memory SQLite test database raises instead of
+                # waiting on locks, so retry until the write goes through
+                for _ in range(200):
+                    try:
+                        Story.objects.set_liked(story.pk, user, True)
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+                errors.append("gave up")
+            except Exception as exc:  # surfaced below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=like) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        story.refresh_from_db()
+        self.assertEqual(story.like_count, 1)
+        self.assertEqual(story.liked_by.count(), 1)